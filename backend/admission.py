@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+from backend.config import env_int
+
+T = TypeVar("T")
+
+
+class Overloaded(Exception):
+    """Raised when a run can't be admitted; the route turns it into a 429."""
+
+    def __init__(self, reason: str, retry_after_s: int = 1):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after_s = retry_after_s
+
+
+class Admission:
+    """
+    Bounded concurrency with a bounded wait queue.
+
+    Up to `max_running` runs execute at once and up to `max_queue` more wait for a slot
+    (at most `queue_timeout_s`). Anything beyond that is rejected immediately, so a burst
+    costs a fast 429 instead of another blocked worker thread. The limits apply per process.
+    """
+
+    def __init__(self, max_running: int, max_queue: int, queue_timeout_s: float):
+        self.max_running = max_running
+        self.max_queue = max_queue
+        self.queue_timeout_s = queue_timeout_s
+        self._sem = asyncio.Semaphore(max_running)
+        self.running = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    async def run(self, fn: Callable[[], Awaitable[T]]) -> T:
+        # `queued` counts every caller not yet running, including ones about to get a free slot
+        if self.running + self.queued >= self.max_running + self.max_queue:
+            self.rejected += 1
+            raise Overloaded("queue full")
+
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._sem.acquire(), timeout=self.queue_timeout_s)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise Overloaded("queue timeout", retry_after_s=int(self.queue_timeout_s) or 1)
+        finally:
+            self.queued -= 1
+
+        self.running += 1
+        self.admitted += 1
+        try:
+            return await fn()
+        finally:
+            self.running -= 1
+            self._sem.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "max_running": self.max_running,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller (the leader) starts the
+    work, later callers await the same task and get the same result (or exception).
+    The task is shielded, so a leader whose client disconnects doesn't cancel the run
+    for everyone attached to it. In-flight keys live in this process only: with several
+    uvicorn workers, identical requests that land on different workers each run.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: Dict[Hashable, "asyncio.Task[Any]"] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """Returns (result, shared); shared is True for callers that attached to another's run."""
+        task = self._inflight.get(key)
+        shared = task is not None
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._inflight.pop(key) if self._inflight.get(key) is t else None)
+        else:
+            self.followers += 1
+        return await asyncio.shield(task), shared
+
+    def stats(self) -> Dict[str, Any]:
+        return {"inflight": len(self._inflight), "leaders": self.leaders, "followers": self.followers}
+
+
+def admission_from_env() -> Admission:
+    return Admission(
+        max_running=env_int("RUN_MAX_CONCURRENT", 4),
+        max_queue=env_int("RUN_MAX_QUEUE", 16),
+        queue_timeout_s=float(os.getenv("RUN_QUEUE_TIMEOUT_S", "30")),
+    )
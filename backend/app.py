@@ -1,30 +1,65 @@
 from __future__ import annotations
 
+import time
+
+_T0 = time.perf_counter()
+
 import os
+import uuid
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 
+from backend.assets import GeneratedFiles
 from backend.graph import build_graph
 from backend.models import GraphState, Market
 from backend.polymarket import get_mock_markets
 from backend.routes.debug_shopify import router as debug_shopify_router
+from backend.thresholds import get_controller
+from backend.image_cache import get_image_cache
+from backend.openrouter_client import model_stats
+from backend.prompts import prompt_stats
+from backend.momentum import get_tracker
+from backend.admission import Overloaded, SingleFlight, admission_from_env
+from backend.tracing import add_span, get_trace_store, start_trace, waterfall
 
 load_dotenv(dotenv_path=Path(__file__).with_name(".env"))
 
-app = FastAPI(title="Prophet Agents", version="0.1.0")
+PROJECT_ROOT = Path(__file__).resolve().parents[1]  # folder containing backend/
+# same dir node_images writes to and shopify_client reads from
+GENERATED_DIR = Path(os.getenv("GENERATED_DIR") or PROJECT_ROOT / "generated")
+
+# timings in seconds since this module started importing; see /debug/startup
+startup_profile: dict = {}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    t = time.perf_counter()
+    startup_profile["module_import_s"] = round(_IMPORTED - _T0, 4)
+
+    GENERATED_DIR.mkdir(parents=True, exist_ok=True)
+    # compiled once per worker before serving, not at import time
+    app.state.graph = build_graph()
+    # created here so they bind to the serving event loop
+    app.state.admission = admission_from_env()
+    app.state.singleflight = SingleFlight()
+    startup_profile["build_graph_s"] = round(time.perf_counter() - t, 4)
+    startup_profile["ready_s"] = round(time.perf_counter() - _T0, 4)
+    print(f"[STARTUP] pid={os.getpid()} {startup_profile}")
+    yield
+
+app = FastAPI(title="Prophet Agents", version="0.1.0", lifespan=lifespan)
 
 
 # ---- NEW: serve generated images
-PROJECT_ROOT = Path(__file__).resolve().parent  # folder containing this app.py
-GENERATED_DIR = PROJECT_ROOT / "generated"
-GENERATED_DIR.mkdir(parents=True, exist_ok=True)
-app.mount("/generated", StaticFiles(directory=str(GENERATED_DIR)), name="generated")
+# check_dir=False: the directory is created in lifespan, not at import
+app.mount("/generated", GeneratedFiles(directory=str(GENERATED_DIR), check_dir=False), name="generated")
 # -------------------------------
 app.include_router(debug_shopify_router)
-graph = build_graph()
 
 @app.get("/")
 def root():
@@ -35,16 +70,107 @@ def health():
     return {"ok": True}
 
 @app.post("/run_one/{market_id}")
-def run_one(market_id: str):
+async def run_one(market_id: str, threshold: float = 0.70, force_images: bool = False):
     markets = {m["market_id"]: m for m in get_mock_markets()}
     m = markets.get(market_id)
     if not m:
         return {"ok": False, "error": "unknown market_id", "known": list(markets.keys())}
 
-    state = GraphState(market=Market(**m))
-    out = graph.invoke(state)
-    return {"ok": True, "state": out}
+    state = GraphState(market=Market(**m), threshold=threshold, force_regenerate_images=force_images)
+
+    async def run():
+        run_id = uuid.uuid4().hex
+        attrs = {"market.id": market_id, "threshold": threshold, "force_images": force_images}
+        with start_trace(run_id, "run_one", **attrs):
+            queued_ns = time.time_ns()
+
+            async def invoke():
+                add_span("admission.queue", queued_ns, time.time_ns())
+                return await run_in_threadpool(app.state.graph.invoke, state)
+
+            # graph.invoke blocks; only admitted runs get a worker thread
+            return run_id, await app.state.admission.run(invoke)
+
+    # concurrent calls for the same market and settings share one pipeline run
+    key = (market_id, threshold, force_images)
+    try:
+        (run_id, out), coalesced = await app.state.singleflight.do(key, run)
+    except Overloaded as e:
+        return JSONResponse(
+            {"ok": False, "error": f"overloaded: {e.reason}"},
+            status_code=429,
+            headers={"Retry-After": str(e.retry_after_s)},
+        )
+    return {"ok": True, "coalesced": coalesced, "run_id": run_id, "state": out}
+
+@app.get("/runs")
+def runs_recent(limit: int = 50):
+    return {"runs": get_trace_store().recent(limit)}
+
+@app.get("/runs/{run_id}/trace")
+def run_trace(run_id: str, format: str = "waterfall"):
+    doc = get_trace_store().otlp(run_id)
+    if doc is None:
+        return JSONResponse({"ok": False, "error": "unknown run_id"}, status_code=404)
+    # format=otlp returns the stored OTLP/JSON as is, e.g. to forward to a collector
+    return doc if format == "otlp" else {"run_id": run_id, **waterfall(doc)}
+
+@app.get("/runs/stats")
+def runs_stats():
+    return {"admission": app.state.admission.stats(), "singleflight": app.state.singleflight.stats()}
+
+@app.get("/thresholds")
+def thresholds():
+    return get_controller().snapshot()
+
+@app.get("/image_cache")
+def image_cache_stats():
+    return get_image_cache().stats()
+
+@app.get("/models/stats")
+def models_stats():
+    return model_stats()
+
+@app.get("/markets/{market_id}/momentum")
+def market_momentum(market_id: str):
+    tracker = get_tracker()
+    out = tracker.history(market_id)
+    m = next((m for m in get_mock_markets() if m["market_id"] == market_id), None)
+    if m:
+        # what the current snapshot would do, without recording it
+        sig = tracker.observe(market_id, m["market_values"], record=False)
+        retrigger, reason = tracker.should_trigger(sig)
+        out["signal"] = {**sig, "retrigger": retrigger, "reason": reason}
+    return out
+
+@app.get("/prompts/stats")
+def prompts_stats():
+    return prompt_stats()
+
+@app.get("/debug/startup")
+def debug_startup():
+    return {"pid": os.getpid(), **startup_profile}
 
 @app.get("/mock_markets")
 def mock_markets():
-    return get_mock_markets()
\ No newline at end of file
+    return get_mock_markets()
+
+_IMPORTED = time.perf_counter()
+
+
+def main():
+    """
+    python -m backend.app  -- WEB_CONCURRENCY=4 runs 4 worker processes (see backend/README.md).
+    """
+    import uvicorn
+
+    uvicorn.run(
+        "backend.app:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "8000")),
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+# Generated asset names are random and never rewritten, so a URL always means the same bytes.
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+# (suffix, content-encoding) in order of preference
+ENCODINGS = ((".br", "br"), (".gz", "gzip"))
+
+# already compressed formats gain nothing from gzip/brotli
+_INCOMPRESSIBLE = {"image/png", "image/jpeg", "image/webp", "image/gif", "image/avif"}
+
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _coding(part: str) -> Tuple[str, float]:
+    # "gzip;q=0.5" -> ("gzip", 0.5)
+    name, _, params = part.partition(";")
+    q = 1.0
+    for param in params.split(";"):
+        k, _, v = param.strip().partition("=")
+        if k == "q":
+            try:
+                q = float(v)
+            except ValueError:
+                q = 0.0
+    return name.strip().lower(), q
+
+
+def precompress(path: str | Path, min_saving: float = 0.1) -> Dict[str, str]:
+    """
+    Writes .gz (and .br when brotli is installed) next to a compressible asset, keeping a
+    variant only if it is at least `min_saving` smaller. Returns {encoding: variant path}.
+
+    Only text-like assets (SVG, JSON, HTML...) benefit. Everything the graph writes to
+    generated/ today is PNG/JPEG/WebP, which is skipped, so this currently saves nothing.
+    """
+    path = Path(path)
+    if mimetypes.guess_type(path.name)[0] in _INCOMPRESSIBLE:
+        return {}
+    raw = path.read_bytes()
+    candidates = {"gzip": (path.with_name(path.name + ".gz"), gzip.compress(raw, compresslevel=9, mtime=0))}
+    try:
+        import brotli
+
+        candidates["br"] = (path.with_name(path.name + ".br"), brotli.compress(raw))
+    except ImportError:
+        pass
+
+    out = {}
+    for encoding, (target, data) in candidates.items():
+        if len(data) <= len(raw) * (1 - min_saving):
+            tmp = target.with_name(target.name + ".tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, target)
+            out[encoding] = str(target)
+    return out
+
+
+class _AssetResponse(FileResponse):
+    def _should_use_range(self, http_if_range: str, stat_result: os.stat_result) -> bool:  # type: ignore[override]
+        # Starlette compares If-Range with its own mtime-based ETag; use the one we sent
+        return http_if_range in (self.headers.get("etag"), self.headers.get("last-modified"))
+
+
+class GeneratedFiles(StaticFiles):
+    """
+    StaticFiles for /generated with cache-friendly responses:
+
+    - strong ETag from the content hash (the same on every worker and machine, unlike
+      Starlette's mtime-based one), so If-None-Match / If-Range hold across restarts
+    - Cache-Control: immutable for a year
+    - a precompressed sibling (<name>.br / <name>.gz) when the client accepts it
+    - Range requests via FileResponse
+
+    Hashes are computed in the lookup thread and remembered per (path, size, mtime).
+    """
+
+    def __init__(self, *args, cache_entries: int = 4096, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._etags: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+        self._cache_entries = cache_entries
+        self._lock = threading.Lock()
+
+    def _etag(self, path: str, st: os.stat_result) -> str:
+        key = (path, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            etag = self._etags.get(key)
+            if etag:
+                self._etags.move_to_end(key)
+                return etag
+        etag = f'"{_sha256(path)[:32]}"'
+        with self._lock:
+            self._etags[key] = etag
+            while len(self._etags) > self._cache_entries:
+                self._etags.popitem(last=False)
+        return etag
+
+    def lookup_path(self, path: str) -> Tuple[str, Optional[os.stat_result]]:
+        # runs in a worker thread (see StaticFiles.get_response): do the hashing here
+        full_path, st = super().lookup_path(path)
+        if st is not None and os.path.isfile(full_path):
+            self._etag(full_path, st)
+            for suffix, _ in ENCODINGS:
+                variant = full_path + suffix
+                if os.path.isfile(variant):
+                    self._etag(variant, os.stat(variant))
+        return full_path, st
+
+    def _variant(self, full_path: str, accept: str) -> Tuple[str, Optional[str]]:
+        accepted = {name for name, q in map(_coding, accept.split(",")) if q > 0}
+        for suffix, encoding in ENCODINGS:
+            if encoding in accepted and os.path.isfile(full_path + suffix):
+                return full_path + suffix, encoding
+        return full_path, None
+
+    def file_response(self, full_path, stat_result, scope: Scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        path, encoding = self._variant(str(full_path), request_headers.get("accept-encoding", ""))
+        st = stat_result if encoding is None else os.stat(path)
+
+        headers = {"cache-control": IMMUTABLE, "etag": self._etag(path, st)}
+        if encoding:
+            headers["content-encoding"] = encoding
+        if self._has_variants(str(full_path)):
+            headers["vary"] = "accept-encoding"
+
+        media_type = mimetypes.guess_type(str(full_path))[0] or "application/octet-stream"
+        response = _AssetResponse(path, status_code=status_code, headers=headers, media_type=media_type, stat_result=st)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+    @staticmethod
+    def _has_variants(full_path: str) -> bool:
+        return any(os.path.isfile(full_path + suffix) for suffix, _ in ENCODINGS)
@@ -0,0 +1,269 @@
+"""
+End-to-end benchmark for backend.graph.build_graph() with stubbed OpenRouter and Shopify.
+
+    python -m backend.bench.graph_bench                          # the 6 mock markets
+    python -m backend.bench.graph_bench --markets 2000 --concurrency 16 \\
+        --text-latency lognormal:0.8,0.4 --image-latency lognormal:12,0.3 --time-scale 0.01
+    python -m backend.bench.graph_bench --save bench/baseline.json
+    python -m backend.bench.graph_bench --compare bench/baseline.json   # exit 1 on regression
+
+Reports runs/sec, per-node p50/p95/p99, peak RSS and allocations per run as JSON.
+The Shopify token bucket is off unless --shopify-rps is given; at the store default (10)
+runs/sec measures the rate limiter rather than the graph.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+from backend.bench.stubs import Latency, stub_backends
+from backend.config import streaming
+from backend.polymarket import get_mock_markets
+
+NODES = [
+    "node_prefilter",
+    "node_oracle_shoppable",
+    "node_ideas",
+    "node_risk",
+    "node_build_products",
+    "node_images",
+    "node_shopify",
+    "node_stop",
+]
+
+
+def synthetic_markets(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """n markets derived from the mock set with jittered probabilities and distinct ids/names."""
+    rng = random.Random(seed)
+    base = get_mock_markets()
+    out = []
+    for k in range(n):
+        m = base[k % len(base)]
+        yes = min(0.99, max(0.01, m["market_values"]["Yes"] + rng.uniform(-0.15, 0.15)))
+        out.append(
+            {
+                "market_id": f"s{k + 1}",
+                "market_name": f"{m['market_name']} #{k + 1}",
+                "market_type": m["market_type"],
+                "market_values": {"Yes": round(yes, 3), "No": round(1 - yes, 3)},
+            }
+        )
+    return out
+
+
+def percentile(xs: List[float], q: float) -> float:
+    if not xs:
+        return 0.0
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(q * len(xs)))]
+
+
+def _summary(xs: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(xs),
+        "p50_ms": round(percentile(xs, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(xs, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(xs, 0.99) * 1000, 3),
+    }
+
+
+def _peak_rss_kib() -> int:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KiB on Linux
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    import backend.graph as graph_mod
+    from backend.models import GraphState, Market
+
+    markets = get_mock_markets() if args.markets == "mock" else synthetic_markets(int(args.markets), args.seed)
+    markets = markets * args.repeat
+
+    timings: Dict[str, List[float]] = {n: [] for n in NODES}
+    lock = threading.Lock()
+
+    def timed(name: str, fn: Callable[[Any], Any]) -> Callable[[Any], Any]:
+        def wrapper(state: Any) -> Any:
+            t0 = time.perf_counter()
+            try:
+                return fn(state)
+            finally:
+                with lock:
+                    timings[name].append(time.perf_counter() - t0)
+        return wrapper
+
+    text = Latency(args.text_latency, args.time_scale, args.seed)
+    image = Latency(args.image_latency, args.time_scale, args.seed + 1)
+    shopify = Latency(args.shopify_latency, args.time_scale, args.seed + 2)
+
+    originals = {n: getattr(graph_mod, n) for n in NODES}
+    try:
+        # build_graph looks node functions up as module globals, so wrapping them here times each node
+        for n, fn in originals.items():
+            setattr(graph_mod, n, timed(n, fn))
+        graph = graph_mod.build_graph()
+
+        run_times: List[float] = []
+        errors: List[str] = []
+
+        def one(m: Dict[str, Any]) -> None:
+            t0 = time.perf_counter()
+            try:
+                graph.invoke(GraphState(market=Market(**m), threshold=args.threshold, force_regenerate_images=not args.image_cache))
+            except Exception as e:
+                with lock:
+                    errors.append(f"{m['market_id']}: {e}")
+            finally:
+                with lock:
+                    run_times.append(time.perf_counter() - t0)
+
+        with stub_backends(text, image, shopify, shopify_rps=args.shopify_rps):
+            for m in markets[: args.warmup]:
+                one(m)
+            run_times.clear()
+            errors.clear()
+            for v in timings.values():
+                v.clear()
+
+            allocs: Dict[str, float] = {}
+            if args.alloc_runs:
+                sample = markets[: args.alloc_runs]
+                tracemalloc.start()
+                before = tracemalloc.take_snapshot()
+                for m in sample:
+                    one(m)
+                after = tracemalloc.take_snapshot()
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                diff = after.compare_to(before, "filename")
+                allocs = {
+                    "sampled_runs": len(sample),
+                    "net_blocks_per_run": round(sum(d.count_diff for d in diff) / len(sample), 1),
+                    "net_kib_per_run": round(sum(d.size_diff for d in diff) / 1024 / len(sample), 2),
+                    "traced_peak_kib": round(peak / 1024, 1),
+                }
+                run_times.clear()
+                for v in timings.values():
+                    v.clear()
+
+            t0 = time.perf_counter()
+            if args.concurrency > 1:
+                with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                    list(pool.map(one, markets))
+            else:
+                for m in markets:
+                    one(m)
+            wall = time.perf_counter() - t0
+    finally:
+        for n, fn in originals.items():
+            setattr(graph_mod, n, fn)
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "markets": args.markets,
+            "runs": len(markets),
+            "concurrency": args.concurrency,
+            "stream": streaming(),
+            "latency": {"text": args.text_latency, "image": args.image_latency, "shopify": args.shopify_latency, "time_scale": args.time_scale},
+            "shopify_rps": args.shopify_rps,
+        },
+        "runs_per_sec": round(len(markets) / wall, 3) if wall > 0 else None,
+        "wall_s": round(wall, 3),
+        "run": _summary(run_times),
+        "nodes": {n.replace("node_", ""): _summary(v) for n, v in timings.items() if v},
+        "peak_rss_kib": _peak_rss_kib(),
+        "allocations": allocs,
+        "errors": errors[:20],
+        "error_count": len(errors),
+    }
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, slack_ms: float) -> List[str]:
+    """Regressions of `result` against `baseline`; empty when within tolerance."""
+    problems = []
+    base_rps, rps = baseline.get("runs_per_sec") or 0, result.get("runs_per_sec") or 0
+    if base_rps and rps < base_rps * (1 - tolerance):
+        problems.append(f"runs_per_sec {rps} < baseline {base_rps} (-{tolerance:.0%})")
+
+    for node, b in (baseline.get("nodes") or {}).items():
+        r = (result.get("nodes") or {}).get(node)
+        if not r:
+            continue
+        for q in ("p50_ms", "p95_ms", "p99_ms"):
+            limit = b[q] * (1 + tolerance) + slack_ms
+            if r[q] > limit:
+                problems.append(f"{node}.{q} {r[q]} > {round(limit, 3)} (baseline {b[q]})")
+
+    if result.get("error_count", 0) > baseline.get("error_count", 0):
+        problems.append(f"error_count {result['error_count']} > baseline {baseline.get('error_count', 0)}")
+    return problems
+
+
+def main(argv: List[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--markets", default="mock", help='"mock" or a number of synthetic markets')
+    ap.add_argument("--repeat", type=int, default=1, help="run the market set this many times")
+    ap.add_argument("--concurrency", type=int, default=1)
+    ap.add_argument("--threshold", type=float, default=0.70)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--warmup", type=int, default=2)
+    ap.add_argument("--text-latency", default="fixed:0", help="e.g. lognormal:0.8,0.4 (seconds)")
+    ap.add_argument("--image-latency", default="fixed:0")
+    ap.add_argument("--shopify-latency", default="fixed:0")
+    ap.add_argument("--shopify-rps", type=float, default=0.0, help="Shopify token-bucket rate (0 = unthrottled, so runs/sec measures the graph)")
+    ap.add_argument("--time-scale", type=float, default=1.0, help="multiply every stub latency")
+    ap.add_argument("--image-cache", action="store_true", help="let the image cache serve repeats")
+    ap.add_argument("--alloc-runs", type=int, default=5, help="runs sampled under tracemalloc (0 = skip)")
+    ap.add_argument("--save", help="write the result JSON here (e.g. a new baseline)")
+    ap.add_argument("--compare", help="baseline JSON to compare against; exit 1 on regression")
+    ap.add_argument("--tolerance", type=float, default=0.15, help="allowed relative slowdown")
+    ap.add_argument("--slack-ms", type=float, default=1.0, help="absolute slack per latency quantile")
+    args = ap.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="prophet-bench-") as tmp:
+        # keep generated files, caches and prefilter feedback out of the real ones,
+        # and pin the prefilter so every run sees the same thresholds
+        os.environ.update(
+            {
+                "GENERATED_DIR": os.path.join(tmp, "generated"),
+                "IMAGE_CACHE_PATH": os.path.join(tmp, "image_cache.sqlite3"),
+                "PREFILTER_STATE_PATH": os.path.join(tmp, "prefilter_state.json"),
+                "MOMENTUM_DB_PATH": os.path.join(tmp, "momentum.sqlite3"),
+                "TRACE_DB_PATH": os.path.join(tmp, "traces.sqlite3"),
+                "PREFILTER_MAX_LOWER": "0",
+            }
+        )
+        result = run(args)
+
+    print(json.dumps(result, indent=2))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        problems = compare(result, baseline, args.tolerance, args.slack_ms)
+        for p in problems:
+            print(f"REGRESSION: {p}", file=sys.stderr)
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
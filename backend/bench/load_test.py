@@ -0,0 +1,333 @@
+"""
+HTTP load test for backend/app.py and prophet/backend/main.py with stubbed upstreams.
+
+    python -m backend.bench.load_test --app backend --mode closed --users 32 --duration 20
+    python -m backend.bench.load_test --app prophet --mode open --rate 500 --duration 20
+    python -m backend.bench.load_test --app backend --server uvicorn --mix "GET /health=5,POST /run_one/m3=1"
+    python -m backend.bench.load_test --app backend --slo backend/bench/slo_backend.json   # exit 1 on breach
+
+Closed loop: --users virtual users, each sends its next request when the last one returns
+(plus --think-ms). Open loop: Poisson arrivals at --rate req/s regardless of completions,
+which is what exposes queueing. Reports throughput, p50/p99/p999 per route and overall,
+error rates and event-loop lag of the server's loop.
+
+slo_backend.json / slo_prophet.json are calibrated, with headroom, on runs at the default
+--users/--duration with either --server; at other loads they are a starting point only.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from backend.bench.graph_bench import percentile
+from backend.bench.stubs import Latency, stub_backends
+
+# (method, path, weight, body factory); "{asset}" is replaced by a generated file name
+Route = Tuple[str, str, float, Optional[Callable[[], Any]]]
+
+
+def _track_batch(n: int) -> Callable[[], Any]:
+    cats = ["Culture", "Sports", "Tech"]
+    types = ["opportunity_viewed", "opportunity_viewed", "opportunity_accepted", "opportunity_rejected"]
+
+    def body() -> Any:
+        return [{"event_type": random.choice(types), "properties": {"category": random.choice(cats)}} for _ in range(n)]
+    return body
+
+
+def profile(app_name: str, track_batch: int) -> List[Route]:
+    if app_name == "backend":
+        return [
+            ("GET", "/mock_markets", 5, None),
+            ("GET", "/generated/{asset}", 4, None),
+            ("GET", "/health", 1, None),
+            ("POST", "/run_one/m3", 1, None),
+        ]
+    return [
+        ("GET", "/api/opportunities?limit=20", 5, None),
+        ("POST", "/api/track", 4, _track_batch(track_batch)),
+        ("GET", "/api/track/aggregates", 1, None),
+        ("GET", "/api/scan", 1, None),
+    ]
+
+
+def parse_mix(spec: str, defaults: List[Route]) -> List[Route]:
+    """'GET /health=5,POST /run_one/m3=1'; bodies are reused from the default profile by path."""
+    bodies = {(m, p): b for m, p, _, b in defaults}
+    out = []
+    for part in spec.split(","):
+        route, _, weight = part.strip().rpartition("=")
+        method, path = route.split(None, 1)
+        out.append((method.upper(), path, float(weight), bodies.get((method.upper(), path))))
+    return out
+
+
+def _prepare_env(tmp: str, assets: int, asset_kib: int) -> List[str]:
+    generated = os.path.join(tmp, "generated")
+    os.makedirs(generated, exist_ok=True)
+    names = []
+    for k in range(assets):
+        name = f"bench{k}.png"
+        with open(os.path.join(generated, name), "wb") as f:
+            f.write(os.urandom(asset_kib * 1024))
+        names.append(name)
+    os.environ.update(
+        {
+            "GENERATED_DIR": generated,
+            "IMAGE_CACHE_PATH": os.path.join(tmp, "image_cache.sqlite3"),
+            "PREFILTER_STATE_PATH": os.path.join(tmp, "prefilter_state.json"),
+            "MOMENTUM_DB_PATH": os.path.join(tmp, "momentum.sqlite3"),
+            "TRACE_DB_PATH": os.path.join(tmp, "traces.sqlite3"),
+            "PROPHET_DB_PATH": os.path.join(tmp, "prophet.sqlite3"),
+        }
+    )
+    return names
+
+
+def _load_app(app_name: str) -> Any:
+    if app_name == "backend":
+        from backend.app import app
+    else:
+        from prophet.backend.main import app
+    return app
+
+
+class _Recorder:
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = {}
+        self.status: Dict[str, Dict[str, int]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def add(self, route: str, seconds: float, status: Optional[int]) -> None:
+        self.latencies.setdefault(route, []).append(seconds)
+        codes = self.status.setdefault(route, {})
+        key = str(status) if status is not None else "exception"
+        codes[key] = codes.get(key, 0) + 1
+        if status is None or status >= 500:
+            self.errors[route] = self.errors.get(route, 0) + 1
+
+
+async def _lag_monitor(samples: List[float], stop: asyncio.Event, interval: float = 0.01) -> None:
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        t0 = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - t0 - interval))
+
+
+async def _drive(client: httpx.AsyncClient, routes: List[Route], assets: List[str], args: argparse.Namespace, rec: _Recorder) -> float:
+    weights = [w for _, _, w, _ in routes]
+    rng = random.Random(args.seed)
+
+    async def fire() -> None:
+        method, path, _, body = rng.choices(routes, weights)[0]
+        url = path.replace("{asset}", rng.choice(assets)) if assets else path
+        t0 = time.perf_counter()
+        status = None
+        try:
+            r = await client.request(method, url, json=body() if body else None)
+            status = r.status_code
+        except Exception:
+            pass
+        rec.add(f"{method} {path}", time.perf_counter() - t0, status)
+
+    deadline = time.perf_counter() + args.duration
+    t_start = time.perf_counter()
+    if args.mode == "closed":
+        async def user() -> None:
+            while time.perf_counter() < deadline:
+                await fire()
+                # in-process requests can complete without ever suspending; yield so the
+                # other users and the lag monitor get the loop
+                await asyncio.sleep(args.think_ms / 1000 if args.think_ms else 0)
+        await asyncio.gather(*(user() for _ in range(args.users)))
+    else:
+        inflight: set = set()
+        while time.perf_counter() < deadline:
+            if len(inflight) < args.max_inflight:
+                t = asyncio.create_task(fire())
+                inflight.add(t)
+                t.add_done_callback(inflight.discard)
+            else:
+                rec.add("dropped (max inflight)", 0.0, None)
+            await asyncio.sleep(rng.expovariate(args.rate))
+        if inflight:
+            await asyncio.gather(*inflight)
+    return time.perf_counter() - t_start
+
+
+async def _run_inprocess(app: Any, routes: List[Route], assets: List[str], args: argparse.Namespace, rec: _Recorder) -> Tuple[float, List[float]]:
+    lag: List[float] = []
+    stop = asyncio.Event()
+    # ASGITransport doesn't run lifespan, so enter it ourselves (prophet starts its event flusher there)
+    async with app.router.lifespan_context(app):
+        monitor = asyncio.create_task(_lag_monitor(lag, stop))
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout) as client:
+            wall = await _drive(client, routes, assets, args, rec)
+        stop.set()
+        await monitor
+    return wall, lag
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _run_uvicorn(app: Any, routes: List[Route], assets: List[str], args: argparse.Namespace, rec: _Recorder) -> Tuple[float, List[float]]:
+    import uvicorn
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    server_loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=server_loop.run_until_complete, args=(server.serve(),), daemon=True)
+    thread.start()
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    # lag is measured on the server's loop, not the load generator's
+    lag: List[float] = []
+    stop = asyncio.Event()
+    monitor = asyncio.run_coroutine_threadsafe(_lag_monitor(lag, stop), server_loop)
+    limits = httpx.Limits(max_connections=max(args.users, args.max_inflight))
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=args.timeout, limits=limits) as client:
+        wall = await _drive(client, routes, assets, args, rec)
+    server_loop.call_soon_threadsafe(stop.set)
+    monitor.result(timeout=5)
+    server.should_exit = True
+    thread.join(timeout=10)
+    return wall, lag
+
+
+def _ms(xs: List[float], q: float) -> float:
+    return round(percentile(xs, q) * 1000, 3)
+
+
+def report(rec: _Recorder, wall: float, lag: List[float], args: argparse.Namespace) -> Dict[str, Any]:
+    all_lat = [x for k, v in rec.latencies.items() if not k.startswith("dropped") for x in v]
+    total = len(all_lat)
+    errors = sum(rec.errors.values())
+    routes = {}
+    for route, xs in rec.latencies.items():
+        routes[route] = {
+            "count": len(xs),
+            "rps": round(len(xs) / wall, 2) if wall else None,
+            "p50_ms": _ms(xs, 0.50),
+            "p99_ms": _ms(xs, 0.99),
+            "p999_ms": _ms(xs, 0.999),
+            "error_rate": round(rec.errors.get(route, 0) / len(xs), 4),
+            "status": rec.status.get(route, {}),
+        }
+    return {
+        "meta": {
+            "app": args.app,
+            "server": args.server,
+            "mode": args.mode,
+            "users": args.users if args.mode == "closed" else None,
+            "rate": args.rate if args.mode == "open" else None,
+            "duration_s": args.duration,
+        },
+        "throughput_rps": round(total / wall, 2) if wall else None,
+        "requests": total,
+        "error_rate": round(errors / total, 4) if total else None,
+        "latency": {"p50_ms": _ms(all_lat, 0.50), "p99_ms": _ms(all_lat, 0.99), "p999_ms": _ms(all_lat, 0.999)},
+        "loop_lag": {"p50_ms": _ms(lag, 0.50), "p99_ms": _ms(lag, 0.99), "max_ms": round(max(lag, default=0.0) * 1000, 3)},
+        "routes": routes,
+    }
+
+
+def check_slo(result: Dict[str, Any], slo: Dict[str, Any]) -> List[str]:
+    """
+    SLO file keys (all optional): min_rps, max_error_rate, p50_ms, p99_ms, p999_ms,
+    loop_lag_p99_ms, and "routes": {"GET /health": {p99_ms, max_error_rate, ...}}.
+    """
+    breaches = []
+
+    def check(scope: str, got: Dict[str, Any], lat: Dict[str, Any], limits: Dict[str, Any]) -> None:
+        for q in ("p50_ms", "p99_ms", "p999_ms"):
+            if q in limits and lat.get(q, 0) > limits[q]:
+                breaches.append(f"{scope} {q} {lat[q]} > {limits[q]}")
+        if "max_error_rate" in limits and (got.get("error_rate") or 0) > limits["max_error_rate"]:
+            breaches.append(f"{scope} error_rate {got['error_rate']} > {limits['max_error_rate']}")
+
+    check("overall", result, result["latency"], slo)
+    if "min_rps" in slo and (result["throughput_rps"] or 0) < slo["min_rps"]:
+        breaches.append(f"throughput {result['throughput_rps']} < {slo['min_rps']}")
+    if "loop_lag_p99_ms" in slo and result["loop_lag"]["p99_ms"] > slo["loop_lag_p99_ms"]:
+        breaches.append(f"loop_lag p99 {result['loop_lag']['p99_ms']} > {slo['loop_lag_p99_ms']}")
+    for route, limits in (slo.get("routes") or {}).items():
+        got = result["routes"].get(route)
+        if got:
+            check(route, got, got, limits)
+    return breaches
+
+
+def main(argv: List[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--app", choices=["backend", "prophet"], default="backend")
+    ap.add_argument("--server", choices=["inprocess", "uvicorn"], default="inprocess")
+    ap.add_argument("--mode", choices=["closed", "open"], default="closed")
+    ap.add_argument("--users", type=int, default=16, help="closed loop: concurrent virtual users")
+    ap.add_argument("--think-ms", type=float, default=0.0)
+    ap.add_argument("--rate", type=float, default=100.0, help="open loop: mean arrivals per second")
+    ap.add_argument("--max-inflight", type=int, default=1000, help="open loop: arrivals beyond this are counted as dropped")
+    ap.add_argument("--duration", type=float, default=10.0)
+    ap.add_argument("--timeout", type=float, default=60.0)
+    ap.add_argument("--mix", help='override the route mix, e.g. "GET /health=5,POST /run_one/m3=1"')
+    ap.add_argument("--track-batch", type=int, default=50, help="events per /api/track request")
+    ap.add_argument("--assets", type=int, default=8, help="files placed in GENERATED_DIR for /generated/*")
+    ap.add_argument("--asset-kib", type=int, default=512)
+    ap.add_argument("--text-latency", default="lognormal:0.8,0.4")
+    ap.add_argument("--image-latency", default="lognormal:12,0.3")
+    ap.add_argument("--shopify-latency", default="uniform:0.1,0.4")
+    ap.add_argument("--time-scale", type=float, default=0.01, help="multiply every stub latency")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--save", help="write the result JSON here")
+    ap.add_argument("--slo", help="SLO thresholds JSON; exit 1 on breach")
+    args = ap.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="prophet-load-") as tmp:
+        assets = _prepare_env(tmp, args.assets, args.asset_kib)
+        routes = profile(args.app, args.track_batch)
+        if args.mix:
+            routes = parse_mix(args.mix, routes)
+
+        text = Latency(args.text_latency, args.time_scale, args.seed)
+        image = Latency(args.image_latency, args.time_scale, args.seed + 1)
+        shopify = Latency(args.shopify_latency, args.time_scale, args.seed + 2)
+        rec = _Recorder()
+        with stub_backends(text, image, shopify):
+            app = _load_app(args.app)
+            runner = _run_inprocess if args.server == "inprocess" else _run_uvicorn
+            wall, lag = asyncio.run(runner(app, routes, assets, args, rec))
+
+    result = report(rec, wall, lag, args)
+    print(json.dumps(result, indent=2))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.slo:
+        with open(args.slo) as f:
+            breaches = check_slo(result, json.load(f))
+        for b in breaches:
+            print(f"SLO BREACH: {b}", file=sys.stderr)
+        return 1 if breaches else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
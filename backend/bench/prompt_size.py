@@ -0,0 +1,120 @@
+"""
+Per-node input-token size of the graph's prompts, current layout vs the old f-string layout.
+
+    python -m backend.bench.prompt_size                 # the 6 mock markets
+    python -m backend.bench.prompt_size --markets 200
+
+Runs the graph with stubbed back ends (no latency), takes the prompt sizes recorded by
+backend.prompts and rebuilds the old user prompts (Python reprs of model_dump(), trailing
+"Return JSON only.") from the same states. System prompts are identical in both layouts
+(the ideas "match the hype" sentence moved into the system prompt and is left out of the
+old user prompt here), so the old size is counted as current system + old user.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+from typing import Any, Dict, List
+
+from backend.bench.graph_bench import synthetic_markets
+from backend.bench.stubs import Latency, stub_backends
+from backend.polymarket import get_mock_markets
+
+
+def legacy_user_prompts(state: Any) -> Dict[str, List[str]]:
+    """The user prompts the graph sent before backend.prompts, rebuilt from a finished state."""
+    m = state.market
+    category = state.oracle.category if state.oracle else m.market_type
+    out: Dict[str, List[str]] = {}
+    if not state.prefilter_passed:
+        return out
+    out["oracle"] = [f"""
+Market name: {m.market_name}
+Market type: {m.market_type}
+Market values: {m.market_values}
+
+Return JSON only.
+"""]
+    if not (state.oracle and state.oracle.shoppable):
+        return out
+    out["ideas"] = [f"""
+Event: {m.market_name}
+Category: {category}
+
+Return JSON only.
+"""]
+    out["risk"] = [f"""
+Market: {m.market_name}
+Ideas: { [i.model_dump() for i in state.ideas] }
+
+Return JSON only.
+"""]
+    allow_map = {r.idea_id: r for r in state.risk if r.allowed}
+    allowed = sorted((i for i in state.ideas if i.idea_id in allow_map), key=lambda i: allow_map[i.idea_id].score, reverse=True)[:2]
+    out["products"] = [f"""
+Market: {m.market_name}
+Category: {category}
+Allowed ideas: { [i.model_dump() for i in allowed] }
+
+Return JSON only.
+"""]
+    return out
+
+
+def run(markets: List[Dict[str, Any]]) -> Dict[str, Any]:
+    from backend.graph import build_graph
+    from backend.models import GraphState, Market
+    from backend.prompts import count_tokens, prompt_stats
+
+    graph = build_graph()
+    legacy: Dict[str, Dict[str, int]] = {}
+    zero = Latency("0")
+    with stub_backends(zero, zero, zero):
+        for m in markets:
+            out = graph.invoke(GraphState(market=Market(**m)))
+            for node, users in legacy_user_prompts(GraphState(**out)).items():
+                n = legacy.setdefault(node, {"calls": 0, "user_tokens": 0})
+                n["calls"] += len(users)
+                n["user_tokens"] += sum(count_tokens(u) for u in users)
+
+    current = prompt_stats()
+    nodes = {}
+    for node, cur in current["nodes"].items():
+        old = legacy.get(node)
+        if not old:
+            continue
+        system = cur["system_tokens"] / cur["calls"]
+        new_in = cur["input_tokens_per_call"]
+        old_in = system + old["user_tokens"] / old["calls"]
+        nodes[node] = {
+            "calls": cur["calls"],
+            "old_input_tokens_per_call": round(old_in, 1),
+            "new_input_tokens_per_call": new_in,
+            "reduction_pct": round(100 * (1 - new_in / old_in), 1) if old_in else 0.0,
+        }
+    return {"tokenizer": current["tokenizer"], "markets": len(markets), "nodes": nodes}
+
+
+def main(argv: List[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--markets", default="mock", help='"mock" or a number of synthetic markets')
+    args = ap.parse_args(argv)
+
+    markets = get_mock_markets() if args.markets == "mock" else synthetic_markets(int(args.markets))
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update(
+            GENERATED_DIR=os.path.join(tmp, "generated"),
+            IMAGE_CACHE_PATH=os.path.join(tmp, "image_cache.sqlite3"),
+            PREFILTER_STATE_PATH=os.path.join(tmp, "prefilter_state.json"),
+            MOMENTUM_DB_PATH=os.path.join(tmp, "momentum.sqlite3"),
+            PREFILTER_MAX_LOWER="0",
+        )
+        print(json.dumps(run(markets), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
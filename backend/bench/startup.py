@@ -0,0 +1,124 @@
+"""
+Cold-start profile for backend/app.py.
+
+    python -m backend.bench.startup                       # import-time breakdown + time-to-first-request
+    python -m backend.bench.startup --save bench/startup.json
+    python -m backend.bench.startup --compare bench/startup.json   # exit 1 on regression
+
+Import time comes from `python -X importtime -c "import backend.app"` in a fresh interpreter.
+Time-to-first-request starts uvicorn in a subprocess and polls /health until it answers 200;
+the server's own /debug/startup numbers (import, build_graph, ready) are included.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from typing import Any, Dict, List
+
+from backend.bench.graph_bench import percentile
+
+
+def import_breakdown(top: int) -> Dict[str, Any]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import backend.app"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|", 2)
+        # one leading space at the top level, two more per nesting level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append({"module": name.strip(), "depth": depth, "self_ms": int(self_us) / 1000, "cumulative_ms": int(cum_us) / 1000})
+
+    total = next((r["cumulative_ms"] for r in rows if r["module"] == "backend.app"), 0.0)
+    # direct dependencies of backend.app plus the heaviest modules anywhere
+    direct = [r for r in rows if r["depth"] == 1]
+    heaviest = sorted(rows, key=lambda r: r["self_ms"], reverse=True)[:top]
+    return {
+        "total_ms": total,
+        "direct": sorted(direct, key=lambda r: r["cumulative_ms"], reverse=True)[:top],
+        "heaviest_self": heaviest,
+        "heavy_loaded": sorted({r["module"].split(".")[0] for r in rows} & {"langgraph", "langchain_core", "openai", "requests"}),
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _get_json(url: str) -> Any:
+    with urllib.request.urlopen(url, timeout=2) as r:
+        return json.loads(r.read())
+
+
+def time_to_first_request(timeout: float = 60.0) -> Dict[str, Any]:
+    port = _free_port()
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.app:app", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - t0 < timeout:
+            try:
+                _get_json(f"http://127.0.0.1:{port}/health")
+                ttfr = time.perf_counter() - t0
+                return {"ttfr_s": round(ttfr, 4), "server": _get_json(f"http://127.0.0.1:{port}/debug/startup")}
+            except OSError:
+                time.sleep(0.02)
+        raise RuntimeError("server did not answer /health in time")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def main(argv: List[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=3, help="cold starts to sample (median is reported)")
+    ap.add_argument("--top", type=int, default=12)
+    ap.add_argument("--save")
+    ap.add_argument("--compare")
+    ap.add_argument("--tolerance", type=float, default=0.25)
+    args = ap.parse_args(argv)
+
+    imports = [import_breakdown(args.top) for _ in range(args.runs)]
+    starts = [time_to_first_request() for _ in range(args.runs)]
+    result = {
+        "import_ms_p50": percentile([i["total_ms"] for i in imports], 0.5),
+        "ttfr_s_p50": percentile([s["ttfr_s"] for s in starts], 0.5),
+        "imports": imports[-1],
+        "server": starts[-1]["server"],
+    }
+    print(json.dumps(result, indent=2))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            base = json.load(f)
+        problems = []
+        for k in ("import_ms_p50", "ttfr_s_p50"):
+            if base.get(k) and result[k] > base[k] * (1 + args.tolerance):
+                problems.append(f"{k} {result[k]} > baseline {base[k]} (+{args.tolerance:.0%})")
+        for p in problems:
+            print(f"REGRESSION: {p}", file=sys.stderr)
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import base64
+import json
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional
+from unittest import mock
+
+import backend.openrouter_client as openrouter_client
+import backend.shopify_client as shopify_client
+
+# 1x1 transparent PNG
+_PNG = base64.b64encode(
+    bytes.fromhex(
+        "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+        "1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082"
+    )
+).decode()
+
+
+class Latency:
+    """
+    Latency distribution parsed from a spec string (seconds):
+      "0" / "fixed:0.05" / "uniform:0.02,0.1" / "lognormal:0.05,0.5" (median, sigma) / "normal:0.05,0.01"
+    `scale` multiplies every sample, so realistic specs can be replayed faster.
+    """
+
+    def __init__(self, spec: str = "0", scale: float = 1.0, seed: Optional[int] = None):
+        self.spec = spec
+        self.scale = scale
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        kind, _, params = spec.partition(":")
+        if not params:
+            kind, params = "fixed", kind
+        self.kind = kind
+        self.params = [float(x) for x in params.split(",") if x]
+
+    def sample(self) -> float:
+        with self._lock:
+            p = self.params
+            if self.kind == "fixed":
+                v = p[0]
+            elif self.kind == "uniform":
+                v = self._rng.uniform(p[0], p[1])
+            elif self.kind == "lognormal":
+                v = p[0] * self._rng.lognormvariate(0.0, p[1])
+            elif self.kind == "normal":
+                v = max(0.0, self._rng.gauss(p[0], p[1]))
+            else:
+                raise ValueError(f"unknown latency kind: {self.kind}")
+        return v * self.scale
+
+    def sleep(self) -> None:
+        d = self.sample()
+        if d > 0:
+            time.sleep(d)
+
+
+# ---- OpenRouter
+
+def _fake_completion(system: str, user: str) -> Dict[str, Any]:
+    """Plausible JSON for each agent prompt in backend.graph."""
+    if "Agent 1" in system:
+        crypto = "crypto" in user.lower() or "bitcoin" in user.lower()
+        return {"shoppable": not crypto, "reason": "stub", "category": "Stub"}
+    if "Agent 2" in system:
+        return {
+            "ideas": [
+                {"idea_id": f"i{k}", "title": f"Idea {k}", "description": "A generic themed item.", "tags": ["stub", f"t{k}"]}
+                for k in range(1, 6)
+            ]
+        }
+    if "Agent 3" in system:
+        ids = sorted(set(re.findall(r"\bi[1-5]\b", user)))
+        return {"risk": [{"idea_id": i, "allowed": True, "score": 40 + 10 * int(i[1]), "flags": [], "notes": ""} for i in ids]}
+    if "Agent 4" in system:
+        ids = sorted(set(re.findall(r"\bi[1-5]\b", user)))
+        return {
+            "products": [
+                {
+                    "idea_id": i,
+                    "title": f"Product {i}",
+                    "price": 24.0,
+                    "description": "Stub product.",
+                    "tags": ["stub"],
+                    "image_prompt": f"plain item {i}",
+                }
+                for i in ids
+            ]
+        }
+    return {}
+
+
+class _Completions:
+    def __init__(self, text: Latency, image: Latency, chunk_chars: int):
+        self.text = text
+        self.image = image
+        self.chunk_chars = chunk_chars
+
+    def create(self, model: str, messages: List[Dict[str, Any]], stream: bool = False, extra_body: Any = None, **_: Any) -> Any:
+        if extra_body and "image" in (extra_body.get("modalities") or []):
+            self.image.sleep()
+            msg = SimpleNamespace(content="", images=[{"image_url": {"url": f"data:image/png;base64,{_PNG}"}}])
+            return SimpleNamespace(choices=[SimpleNamespace(message=msg)])
+
+        system = next((m["content"] for m in messages if m["role"] == "system"), "")
+        user = next((m["content"] for m in messages if m["role"] == "user"), "")
+        content = json.dumps(_fake_completion(system, user))
+        if not stream:
+            self.text.sleep()
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+        return self._stream(content)
+
+    def _stream(self, content: str) -> Iterator[Any]:
+        # total latency is spread over the chunks so time-to-first-item is realistic
+        chunks = [content[i : i + self.chunk_chars] for i in range(0, len(content), self.chunk_chars)]
+        per_chunk = self.text.sample() / max(1, len(chunks))
+        for c in chunks:
+            if per_chunk > 0:
+                time.sleep(per_chunk)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=c))])
+
+
+class FakeOpenAI:
+    def __init__(self, text: Latency, image: Latency, chunk_chars: int = 32):
+        self.chat = SimpleNamespace(completions=_Completions(text, image, chunk_chars))
+
+
+# ---- Shopify
+
+class _Response:
+    def __init__(self, payload: Dict[str, Any], status_code: int = 200):
+        self._payload = payload
+        self.status_code = status_code
+        self.text = json.dumps(payload)
+        self.content = self.text.encode("utf-8")
+
+    def json(self) -> Dict[str, Any]:
+        return self._payload
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class FakeShopifyRequests:
+    """Stands in for the `requests` module returned by backend.shopify_client._http()."""
+
+    def __init__(self, latency: Latency):
+        self.latency = latency
+        self._n = 0
+        self._lock = threading.Lock()
+
+    # requests.Session / HTTPAdapter stand-ins used by ShopifyStore.session()
+    adapters = SimpleNamespace(HTTPAdapter=lambda **_: None)
+
+    def Session(self) -> "FakeShopifyRequests":
+        return self
+
+    def mount(self, prefix: str, adapter: Any) -> None:
+        pass
+
+    def _next_id(self) -> int:
+        with self._lock:
+            self._n += 1
+            return self._n
+
+    def post(self, url: str, json: Optional[Dict[str, Any]] = None, **_: Any) -> _Response:
+        self.latency.sleep()
+        if json is None:
+            # staged upload of the image file itself
+            return _Response({})
+        q = json.get("query") or ""
+        if "productCreate" in q:
+            n = self._next_id()
+            product = {
+                "id": f"gid://shopify/Product/{n}",
+                "title": json["variables"]["product"]["title"],
+                "variants": {"edges": [{"node": {"id": f"gid://shopify/ProductVariant/{n}"}}]},
+            }
+            return _Response({"data": {"productCreate": {"product": product, "userErrors": []}}})
+        if "productVariantsBulkUpdate" in q:
+            return _Response({"data": {"productVariantsBulkUpdate": {"product": {}, "productVariants": [], "userErrors": []}}})
+        if "stagedUploadsCreate" in q:
+            target = {"url": "https://stub-upload.invalid/", "resourceUrl": "https://stub-upload.invalid/r", "parameters": []}
+            return _Response({"data": {"stagedUploadsCreate": {"stagedTargets": [target], "userErrors": []}}})
+        if "productUpdate" in q:
+            return _Response({"data": {"productUpdate": {"product": {}, "userErrors": []}}})
+        if "publishablePublishToCurrentChannel" in q:
+            return _Response({"data": {"publishablePublishToCurrentChannel": {"userErrors": []}}})
+        return _Response({"data": {}})
+
+
+@contextmanager
+def stub_backends(
+    text: Latency,
+    image: Latency,
+    shopify: Latency,
+    chunk_chars: int = 32,
+    shopify_rps: Optional[float] = None,
+) -> Iterator[None]:
+    """
+    Swaps the OpenRouter client and Shopify HTTP layer for local stubs. Everything above
+    them (routing, JSON parsing, pydantic validation, base64 decoding, file writes) runs for real.
+    `shopify_rps` overrides the store's token bucket (SHOPIFY_RPS / SHOPIFY_BURST, burst = 4 s
+    worth); 0 takes the throttle out of the measurement, None keeps the store's own limits.
+    """
+    fake_openai = FakeOpenAI(text, image, chunk_chars)
+    fake_requests = FakeShopifyRequests(shopify)
+    env = {
+        "OPENROUTER_API_KEY": "stub",
+        "SHOPIFY_STORE_DOMAIN": "stub.myshopify.com",
+        "SHOPIFY_ACCESS_TOKEN": "stub",
+    }
+    if shopify_rps is not None:
+        rps = shopify_rps if shopify_rps > 0 else 1e9
+        env.update(SHOPIFY_RPS=str(rps), SHOPIFY_BURST=str(int(rps * 4)))
+    with mock.patch.dict("os.environ", env), \
+         mock.patch.object(openrouter_client, "_client", lambda: fake_openai), \
+         mock.patch.object(shopify_client, "_http", lambda: fake_requests):
+        # stores cache their session, so rebuild them against the stub
+        shopify_client.reload_stores()
+        try:
+            yield
+        finally:
+            shopify_client.reload_stores()
@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+import os
+
+
+def env_float(name: str, default: float) -> float:
+    """float(os.getenv(name)), falling back to `default` when unset or unparsable."""
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def streaming() -> bool:
+    # OR_STREAM=1: ideas/products are parsed as they stream and the next stage starts per item
+    return os.getenv("OR_STREAM", "0") == "1"
@@ -1,28 +1,50 @@
 from __future__ import annotations
 
 from typing import Dict, Any, List
-from langgraph.graph import StateGraph, END
 from pathlib import Path
 from backend.models import GraphState, OracleOut, ProductIdea, RiskScore, FinalProduct
-from backend.openrouter_client import call_json, call_image_data_url, save_data_url
-from backend.shopify_client import create_products
+from backend.openrouter_client import call_json, call_json_stream, call_image, save_data_url, model_candidates
+from backend.shopify_client import create_products_in_stores
+from backend.config import streaming
+from backend.thresholds import get_controller
+from backend.momentum import get_tracker
+from backend import tracing
+from backend.image_cache import get_image_cache
+from backend.prompts import build, canonical, market_context
 
 import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 
 def _log(state: GraphState, msg: str) -> GraphState:
     state.log.append(msg)
     return state
 
 def node_prefilter(state: GraphState) -> Dict[str, Any]:
-    passed = state.market.top_prob >= state.threshold
-    msg = f"[PREFILTER] top_prob={state.market.top_prob:.2f} threshold={state.threshold:.2f} passed={passed}"
+    tracker = get_tracker()
+    sig = tracker.observe(state.market.market_id, state.market.market_values)
+    retrigger, why = tracker.should_trigger(sig)
+    momentum = f"velocity={sig['velocity']:+.3f}/h accel={sig['acceleration']:+.3f}/h2 trigger={why}"
+    if state.sweep and not retrigger:
+        msg = f"[PREFILTER] top_prob={state.market.top_prob:.2f} {momentum} passed=False"
+        return {"prefilter_passed": False, "log": state.log + [msg]}
+
+    # state.threshold is the base; the controller raises it for categories users keep rejecting
+    d = get_controller().decide(state.market.market_type, state.market.top_prob, base=state.threshold)
+    passed = d["passed"]
+    if passed:
+        tracker.mark_triggered(sig)
+    msg = (
+        f"[PREFILTER] top_prob={state.market.top_prob:.2f} threshold={d['threshold']:.2f} "
+        f"skip_p={d['skip_probability']:.2f} skipped={d['skipped']} {momentum} passed={passed}"
+    )
     return {"prefilter_passed": passed, "log": state.log + [msg]}
 
 def route_after_prefilter(state: GraphState) -> str:
     return "oracle" if state.prefilter_passed else "stop"
 
 def node_oracle_shoppable(state: GraphState) -> Dict[str, Any]:
-    model = os.getenv("OR_TEXT_MODEL", "openai/gpt-4o-mini")
+    model = model_candidates("OR_TEXT_MODEL", "openai/gpt-4o-mini")
 
     system = (
         "You are Agent 1 Oracle. Decide if the market can be turned into shoppable products "
@@ -31,13 +53,12 @@ def node_oracle_shoppable(state: GraphState) -> Dict[str, Any]:
         "If sports, entertainment, or holiday event, set shoppable=true. "
         "If crypto, medical claims, violence, hate, or real-person likeness, set shoppable=false."
     )
-    user = f"""
-Market name: {state.market.market_name}
-Market type: {state.market.market_type}
-Market values: {state.market.market_values}
-
-Return JSON only.
-"""
+    system, user = build(
+        "oracle",
+        system,
+        market_context(state.market.market_name, state.market.market_type),
+        note=f"Values: {canonical(state.market.market_values)}",
+    )
     raw = call_json(model=model, system=system, user=user)
     out = OracleOut(**raw)
 
@@ -47,50 +68,66 @@ Return JSON only.
 def route_after_oracle(state: GraphState) -> str:
     return "ideas" if state.oracle and state.oracle.shoppable else "stop"
 
+_stage_pool = ThreadPoolExecutor(max_workers=int(os.getenv("GRAPH_STAGE_WORKERS", "8")), thread_name_prefix="graph-stage")
+
+def _context(state: GraphState) -> str:
+    # the same bytes in every node's prompt for one market
+    return market_context(state.market.market_name, state.oracle.category if state.oracle else state.market.market_type)
+
 def node_ideas(state: GraphState) -> Dict[str, Any]:
-    model = os.getenv("OR_BRAINSTORM_MODEL", "openai/gpt-4o-mini")
+    model = model_candidates("OR_BRAINSTORM_MODEL", "openai/gpt-4o-mini")
 
     system = (
         "You are Agent 2 Merchandiser. Brainstorm 5 product ideas for a Shopify store. "
         "No trademarked logos, no copyrighted art, no direct celebrity name use. "
         "Return JSON only with: ideas: [{idea_id, title, description, tags[]}]. "
-        "Use idea_id values i1..i5."
+        "Use idea_id values i1..i5. Give ideas that match the hype but stay generic and safe."
     )
-    user = f"""
-Event: {state.market.market_name}
-Category: {state.oracle.category if state.oracle else state.market.market_type}
+    system, user = build("ideas", system, _context(state))
+    if not streaming():
+        raw = call_json(model=model, system=system, user=user)
+        ideas = [ProductIdea(**x) for x in raw.get("ideas", [])]
 
-Give ideas that match the hype but stay generic and safe.
-Return JSON only.
-"""
-    raw = call_json(model=model, system=system, user=user)
-    ideas = [ProductIdea(**x) for x in raw.get("ideas", [])]
+        msg = f"[IDEAS] generated={len(ideas)}"
+        return {"ideas": ideas, "log": state.log + [msg]}
 
-    msg = f"[IDEAS] generated={len(ideas)}"
-    return {"ideas": ideas, "log": state.log + [msg]}
+    # score each idea for risk as soon as it closes, while the rest are still streaming
+    ideas = []
+    pending: List[Future] = []
+    for x in call_json_stream(model=model, system=system, user=user, key="ideas"):
+        idea = ProductIdea(**x)
+        ideas.append(idea)
+        pending.append(_stage_pool.submit(tracing.bind(_score_risk), state, [idea]))
+    risk = [r for f in pending for r in f.result()]
 
-def node_risk(state: GraphState) -> Dict[str, Any]:
-    model = os.getenv("OR_RISK_MODEL", "openai/gpt-4o-mini")
+    msg = f"[IDEAS] generated={len(ideas)} streamed=True risk_scored={len(risk)}"
+    return {"ideas": ideas, "risk": risk, "log": state.log + [msg]}
+
+def _score_risk(state: GraphState, ideas: List[ProductIdea]) -> List[RiskScore]:
+    model = model_candidates("OR_RISK_MODEL", "openai/gpt-4o-mini")
 
     system = (
         "You are Agent 3 Risk and Compliance. Score each idea 0-100 and decide allowed true or false. "
         "Flag: politics persuasion, medical claims, hate symbols, violence, adult content, IP infringement, real-person likeness. "
         "Return JSON only with: risk: [{idea_id, allowed, score, flags[], notes}]."
     )
-    user = f"""
-Market: {state.market.market_name}
-Ideas: { [i.model_dump() for i in state.ideas] }
-
-Return JSON only.
-"""
+    system, user = build("risk", system, _context(state), {"ideas": ideas})
     raw = call_json(model=model, system=system, user=user)
-    risk = [RiskScore(**x) for x in raw.get("risk", [])]
+    return [RiskScore(**x) for x in raw.get("risk", [])]
+
+def node_risk(state: GraphState) -> Dict[str, Any]:
+    scored = {r.idea_id for r in state.risk}
+    if state.ideas and all(i.idea_id in scored for i in state.ideas):
+        # already scored per idea while the ideas streamed in
+        return {"log": state.log + [f"[RISK] scored={len(state.risk)} (streamed)"]}
+
+    risk = _score_risk(state, state.ideas)
 
     msg = f"[RISK] scored={len(risk)}"
     return {"risk": risk, "log": state.log + [msg]}
 
 def node_build_products(state: GraphState) -> Dict[str, Any]:
-    model = os.getenv("OR_PRODUCT_MODEL", "openai/gpt-4o-mini")
+    model = model_candidates("OR_PRODUCT_MODEL", "openai/gpt-4o-mini")
 
     # keep only allowed ideas, top 2 by score for image generation stability
     allow_map = {r.idea_id: r for r in state.risk if r.allowed}
@@ -103,75 +140,116 @@ def node_build_products(state: GraphState) -> Dict[str, Any]:
         "No brand names, no copyrighted logos, no celebrity names, no political messaging. "
         "Return JSON only with: products: [{idea_id, title, price, description, tags[], image_prompt}]."
     )
-    user = f"""
-Market: {state.market.market_name}
-Category: {state.oracle.category if state.oracle else state.market.market_type}
-Allowed ideas: { [i.model_dump() for i in allowed_ideas] }
+    system, user = build("products", system, _context(state), {"ideas": allowed_ideas})
+    if not streaming():
+        raw = call_json(model=model, system=system, user=user)
+        products = [FinalProduct(**x) for x in raw.get("products", [])]
+
+        msg = f"[PRODUCTS] built={len(products)}"
+        return {"final_products": products, "log": state.log + [msg]}
+
+    # start each product's image as soon as the product closes; node_images skips rendered ones
+    images = _ImageRenderer(state)
+    products = []
+    pending: List[Future] = []
+    for x in call_json_stream(model=model, system=system, user=user, key="products"):
+        p = FinalProduct(**x)
+        products.append(p)
+        pending.append(_stage_pool.submit(tracing.bind(images.render), p))
+    hits = sum(1 for f in pending if f.result())
+
+    msg = f"[PRODUCTS] built={len(products)} streamed=True images={len(pending)} cached={hits}"
+    return {"final_products": products, "log": state.log + [msg]}
 
-Return JSON only.
-"""
-    raw = call_json(model=model, system=system, user=user)
-    products = [FinalProduct(**x) for x in raw.get("products", [])]
+class _ImageRenderer:
+    def __init__(self, state: GraphState):
+        self.image_models = model_candidates("OR_IMAGE_MODEL", "google/gemini-3-pro-image-preview")
 
-    msg = f"[PRODUCTS] built={len(products)}"
-    return {"final_products": products, "log": state.log + [msg]}
+        # same dir as app.py uses
+        self.out_dir = Path(os.getenv("GENERATED_DIR") or Path(__file__).resolve().parents[1] / "generated")  # project-root/generated
+        self.out_dir.mkdir(exist_ok=True)
 
-def node_images(state: GraphState) -> Dict[str, Any]:
-    image_model = os.getenv("OR_IMAGE_MODEL", "google/gemini-3-pro-image-preview")
+        self.cache = get_image_cache()
+        self.force = state.force_regenerate_images or os.getenv("IMAGE_CACHE_FORCE", "") == "1"
 
-    # same dir as app.py uses
-    out_dir = Path(__file__).resolve().parents[1] / "generated"  # project-root/generated
-    out_dir.mkdir(exist_ok=True)
+    def render(self, p: FinalProduct) -> bool:
+        """Sets p.image_data_url; returns True on a cache hit."""
+        with tracing.span("image.render", **{"product.idea_id": p.idea_id}) as sp:
+            hit = self._render(p)
+            sp.set(cache_hit=hit)
+            return hit
 
-    updated: List[FinalProduct] = []
-    for p in state.final_products:
+    def _render(self, p: FinalProduct) -> bool:
         prompt = (
             "Generate a clean ecommerce product photo on a plain studio background. "
             "No logos, no text in the image, no real people, no celebrity likeness. "
             f"Product: {p.title}. Visual details: {p.image_prompt}"
         )
 
-        data_url = call_image_data_url(model=image_model, prompt=prompt)
-        local_url = save_data_url(data_url, out_dir=out_dir)
+        local_url = None
+        if not self.force:
+            # an image from any acceptable candidate model will do
+            local_url = self.cache.get_any(self.image_models, prompt, out_dir=self.out_dir)
+        hit = bool(local_url)
+        if not hit:
+            if self.force:
+                self.cache.record_forced()
+            # fails over across the candidates; the cache key names the model that actually drew it
+            t0 = time.monotonic()
+            image_model, data_url = call_image(model=self.image_models, prompt=prompt)
+            local_url = save_data_url(data_url, out_dir=self.out_dir)
+            self.cache.put(image_model, prompt, local_url, gen_seconds=time.monotonic() - t0)
 
         p.image_data_url = local_url  # now small: "/generated/abc.png"
-        updated.append(p)
+        return hit
+
+def node_images(state: GraphState) -> Dict[str, Any]:
+    images = _ImageRenderer(state)
 
-    msg = f"[IMAGES] generated={len(updated)} model={image_model}"
-    return {"final_products": updated, "log": state.log + [msg]}
+    todo = [p for p in state.final_products if not p.image_data_url]
+    hits = sum(1 for p in todo if images.render(p))
+
+    msg = f"[IMAGES] generated={len(todo) - hits} cached={hits} models={','.join(images.image_models)}"
+    return {"final_products": state.final_products, "log": state.log + [msg]}
 
 
 def node_shopify(state: GraphState) -> Dict[str, Any]:
     payload = [p.model_dump() for p in state.final_products]
-    result = create_products(payload)
-    msg = f"[SHOPIFY] mode={result.get('mode')} created={len(result.get('created', []))} errors={len(result.get('errors', []))}"
+    # LLM and image work is done once; publishing fans out to every registered store
+    result = create_products_in_stores(payload)
+    get_controller().record_shopify_result(state.market.market_type, result)
+    msg = f"[SHOPIFY] mode={result.get('mode')} stores={len(result.get('stores', {}))} created={len(result.get('created', []))} errors={len(result.get('errors', []))}"
     return {"shopify_result": result, "log": state.log + [msg]}
 
 def node_stop(state: GraphState) -> Dict[str, Any]:
     return {"log": state.log + ["[STOP] ended early"]}
 
 def build_graph():
+    # langgraph is heavy to import; pay for it when the graph is built, not when the module loads
+    from langgraph.graph import StateGraph, END
+
     g = StateGraph(GraphState)
 
-    g.add_node("prefilter", node_prefilter)
-    g.add_node("oracle", node_oracle_shoppable)
-    g.add_node("ideas", node_ideas)
-    g.add_node("risk", node_risk)
-    g.add_node("products", node_build_products)
-    g.add_node("images", node_images)
-    g.add_node("shopify", node_shopify)
-    g.add_node("stop", node_stop)
+    # node names must not collide with GraphState keys (oracle, ideas, risk)
+    g.add_node("prefilter", tracing.traced("node.prefilter", node_prefilter))
+    g.add_node("oracle_node", tracing.traced("node.oracle", node_oracle_shoppable))
+    g.add_node("ideas_node", tracing.traced("node.ideas", node_ideas))
+    g.add_node("risk_node", tracing.traced("node.risk", node_risk))
+    g.add_node("products", tracing.traced("node.products", node_build_products))
+    g.add_node("images", tracing.traced("node.images", node_images))
+    g.add_node("shopify", tracing.traced("node.shopify", node_shopify))
+    g.add_node("stop", tracing.traced("node.stop", node_stop))
 
     g.set_entry_point("prefilter")
 
-    g.add_conditional_edges("prefilter", route_after_prefilter, {"oracle": "oracle", "stop": "stop"})
-    g.add_conditional_edges("oracle", route_after_oracle, {"ideas": "ideas", "stop": "stop"})
+    g.add_conditional_edges("prefilter", route_after_prefilter, {"oracle": "oracle_node", "stop": "stop"})
+    g.add_conditional_edges("oracle_node", route_after_oracle, {"ideas": "ideas_node", "stop": "stop"})
 
-    g.add_edge("ideas", "risk")
-    g.add_edge("risk", "products")
+    g.add_edge("ideas_node", "risk_node")
+    g.add_edge("risk_node", "products")
     g.add_edge("products", "images")
     g.add_edge("images", "shopify")
     g.add_edge("shopify", END)
     g.add_edge("stop", END)
 
-    return g.compile()
\ No newline at end of file
+    return g.compile()
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Case, punctuation and whitespace differences don't change the picture,
+    so they shouldn't change the cache key either.
+    """
+    p = prompt.lower()
+    p = re.sub(r"[^\w\s]", " ", p)
+    return " ".join(p.split())
+
+
+def cache_key(model: str, prompt: str) -> str:
+    return hashlib.sha256(f"{model}\n{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+
+class ImageCache:
+    """
+    Maps (model, normalized prompt) -> an already generated "/generated/..." asset.
+
+    The index is a SQLite file (IMAGE_CACHE_PATH) so several workers share it. An entry
+    only counts as a hit if it is younger than IMAGE_CACHE_TTL_SECONDS (0 = no expiry)
+    and its file still exists under out_dir.
+    """
+
+    def __init__(self, path: Optional[str | Path] = None, ttl_seconds: Optional[float] = None):
+        self.path = str(path or os.getenv("IMAGE_CACHE_PATH", Path(__file__).with_name("image_cache.sqlite3")))
+        self.ttl_seconds = float(ttl_seconds if ttl_seconds is not None else os.getenv("IMAGE_CACHE_TTL_SECONDS", 30 * 86400))
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS images (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                url TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                gen_seconds REAL NOT NULL DEFAULT 0,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        self._db.commit()
+
+        self.hits = 0
+        self.misses = 0
+        self.forced = 0
+        self.seconds_saved = 0.0
+
+    def get(self, model: str, prompt: str, out_dir: str | Path) -> Optional[str]:
+        return self.get_any([model], prompt, out_dir)
+
+    def get_any(self, models: Sequence[str], prompt: str, out_dir: str | Path) -> Optional[str]:
+        """
+        An image of `prompt` from any of `models`, preferring earlier ones. One lookup,
+        counted as exactly one hit or one miss however many models are probed.
+        """
+        keys = {cache_key(m, prompt): i for i, m in enumerate(models)}
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT key, url, created_at, gen_seconds FROM images WHERE key IN ({','.join('?' * len(keys))})",
+                list(keys),
+            ).fetchall()
+            for key, url, created_at, gen_seconds in sorted(rows, key=lambda r: keys[r[0]]):
+                fresh = self.ttl_seconds <= 0 or time.time() - created_at < self.ttl_seconds
+                if fresh and (Path(out_dir) / Path(url).name).exists():
+                    self._db.execute("UPDATE images SET hits = hits + 1 WHERE key = ?", (key,))
+                    self._db.commit()
+                    self.hits += 1
+                    self.seconds_saved += gen_seconds
+                    return url
+            self.misses += 1
+            return None
+
+    def put(self, model: str, prompt: str, url: str, gen_seconds: float = 0.0) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO images (key, model, url, created_at, gen_seconds, hits) VALUES (?, ?, ?, ?, ?, 0)",
+                (cache_key(model, prompt), model, url, time.time(), gen_seconds),
+            )
+            self._db.commit()
+
+    def record_forced(self) -> None:
+        with self._lock:
+            self.forced += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "forced": self.forced,
+            "hit_rate": (self.hits / lookups) if lookups else None,
+            "seconds_saved": round(self.seconds_saved, 2),
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+
+_cache: Optional[ImageCache] = None
+
+
+def get_image_cache() -> ImageCache:
+    global _cache
+    if _cache is None:
+        _cache = ImageCache()
+    return _cache
@@ -48,6 +48,9 @@ class FinalProduct(BaseModel):
 class GraphState(BaseModel):
     market: Market
     threshold: float = 0.70
+    force_regenerate_images: bool = False
+    # sweeps only re-run a market whose probability trajectory changed (see backend.momentum)
+    sweep: bool = False
 
     prefilter_passed: bool = False
     oracle: Optional[OracleOut] = None
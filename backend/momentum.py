@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.config import env_float
+
+HOUR = 3600.0
+
+
+def _slope(ts: List[float], ps: List[float]) -> float:
+    """Least-squares dp/dt, per hour."""
+    n = len(ts)
+    if n < 2:
+        return 0.0
+    mt, mp = sum(ts) / n, sum(ps) / n
+    var = sum((t - mt) ** 2 for t in ts)
+    if var <= 0:
+        return 0.0
+    return sum((t - mt) * (p - mp) for t, p in zip(ts, ps)) / var * HOUR
+
+
+class MomentumTracker:
+    """
+    Probability history per market outcome, and the velocity signals derived from it.
+
+    Each polled snapshot is appended to a ring buffer of MOMENTUM_CAPACITY samples per
+    (market, outcome), kept in SQLite as one row per slot: an observation overwrites a
+    single slot instead of rewriting the whole history. Velocity is the least-squares slope over the newest
+    MOMENTUM_FIT_POINTS samples (probability points per hour); acceleration is the change
+    between the slopes of the older and newer half of that window (per hour^2). Crossing
+    one of MOMENTUM_LEVELS between two consecutive snapshots is reported as an event.
+
+    A market is re-triggered only when its trajectory changed materially since it last
+    ran: a level crossing, a velocity change of MOMENTUM_RETRIGGER_DV or a probability
+    move of MOMENTUM_RETRIGGER_DP. Buffers and trigger points live in SQLite
+    (MOMENTUM_DB_PATH) so API workers and sweep workers share them; each observation is
+    one BEGIN IMMEDIATE transaction, so concurrent writers can't drop each other's samples.
+    """
+
+    def __init__(self, path: Optional[str | Path] = None, capacity: Optional[int] = None):
+        self.path = str(path or os.getenv("MOMENTUM_DB_PATH", Path(__file__).with_name("momentum.sqlite3")))
+        self.capacity = int(capacity or env_float("MOMENTUM_CAPACITY", 64))
+        self.fit_points = max(2, int(env_float("MOMENTUM_FIT_POINTS", 8)))
+        self.levels = sorted(float(x) for x in os.getenv("MOMENTUM_LEVELS", "0.5,0.6,0.7,0.8,0.9").split(",") if x.strip())
+        self.retrigger_dv = env_float("MOMENTUM_RETRIGGER_DV", 0.05)
+        self.retrigger_dp = env_float("MOMENTUM_RETRIGGER_DP", 0.05)
+        self.w_velocity = env_float("MOMENTUM_VELOCITY_WEIGHT", 2.0)
+        self.w_accel = env_float("MOMENTUM_ACCEL_WEIGHT", 0.5)
+        self.crossing_bonus = env_float("MOMENTUM_CROSSING_BONUS", 0.1)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS ring_heads (
+                market_id TEXT NOT NULL,
+                outcome TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                PRIMARY KEY (market_id, outcome)
+            );
+            CREATE TABLE IF NOT EXISTS ring_samples (
+                market_id TEXT NOT NULL,
+                outcome TEXT NOT NULL,
+                slot INTEGER NOT NULL,
+                seq INTEGER NOT NULL,
+                ts REAL NOT NULL,
+                p REAL NOT NULL,
+                PRIMARY KEY (market_id, outcome, slot)
+            );
+            CREATE TABLE IF NOT EXISTS triggers (
+                market_id TEXT PRIMARY KEY,
+                ts REAL NOT NULL,
+                prob REAL NOT NULL,
+                velocity REAL NOT NULL
+            );
+            """
+        )
+        self._db.commit()
+
+    # ---- storage
+
+    def _last(self, market_id: str, outcome: str, n: int) -> Tuple[List[float], List[float], int]:
+        """Oldest-first (ts, p) of the newest n samples, and how many the ring holds."""
+        rows = self._db.execute(
+            "SELECT ts, p FROM ring_samples WHERE market_id = ? AND outcome = ? ORDER BY seq DESC",
+            (market_id, outcome),
+        ).fetchall()
+        # slots past a since-lowered capacity are left behind; only the newest `capacity` count
+        rows = rows[: self.capacity]
+        recent = rows[:n][::-1]
+        return [t for t, _ in recent], [p for _, p in recent], len(rows)
+
+    def _append(self, market_id: str, outcome: str, ts: float, p: float) -> None:
+        row = self._db.execute(
+            "SELECT seq FROM ring_heads WHERE market_id = ? AND outcome = ?", (market_id, outcome)
+        ).fetchone()
+        seq = row[0] + 1 if row else 0
+        self._db.execute(
+            "INSERT OR REPLACE INTO ring_samples (market_id, outcome, slot, seq, ts, p) VALUES (?, ?, ?, ?, ?, ?)",
+            (market_id, outcome, seq % self.capacity, seq, ts, p),
+        )
+        self._db.execute(
+            "INSERT OR REPLACE INTO ring_heads (market_id, outcome, seq) VALUES (?, ?, ?)", (market_id, outcome, seq)
+        )
+
+    # ---- signals
+
+    def _signal(self, market_id: str, outcome: str, ts: List[float], ps: List[float], samples: int) -> Dict[str, Any]:
+        velocity = _slope(ts, ps)
+        acceleration = 0.0
+        if len(ts) >= 4:
+            h = len(ts) // 2
+            dt = ((ts[-1] + ts[h]) - (ts[h - 1] + ts[0])) / 2 / HOUR
+            if dt > 0:
+                acceleration = (_slope(ts[h:], ps[h:]) - _slope(ts[:h], ps[:h])) / dt
+
+        crossings = []
+        if len(ps) >= 2:
+            a, b = ps[-2], ps[-1]
+            for lv in self.levels:
+                if a < lv <= b:
+                    crossings.append({"level": lv, "direction": "up"})
+                elif b < lv <= a:
+                    crossings.append({"level": lv, "direction": "down"})
+
+        prob = ps[-1] if ps else 0.0
+        ups = sum(1 for c in crossings if c["direction"] == "up")
+        score = prob + self.w_velocity * velocity + self.w_accel * acceleration + self.crossing_bonus * ups
+        return {
+            "market_id": market_id,
+            "outcome": outcome,
+            "prob": prob,
+            "velocity": round(velocity, 6),
+            "acceleration": round(acceleration, 6),
+            "crossings": crossings,
+            "samples": samples,
+            "score": round(score, 6),
+        }
+
+    def observe(self, market_id: str, values: Dict[str, float], ts: Optional[float] = None, record: bool = True) -> Dict[str, Any]:
+        """
+        Appends one snapshot of every outcome and returns the signal for the leading one.
+        With record=False the snapshot is only used to compute the signal (a dry run).
+        """
+        ts = time.time() if ts is None else ts
+        if not values:
+            return self._signal(market_id, "", [], [], 0)
+        top = max(values, key=lambda k: values[k])
+        with self._lock:
+            if not record:
+                t, p, count = self._last(market_id, top, self.fit_points - 1)
+                return self._signal(market_id, top, t + [ts], p + [float(values[top])], min(count + 1, self.capacity))
+            # one write transaction from read to write, so two processes can't both append to the same old head
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for outcome, p in values.items():
+                    self._append(market_id, outcome, ts, float(p))
+                t, p, count = self._last(market_id, top, self.fit_points)
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+        return self._signal(market_id, top, t, p, count)
+
+    def should_trigger(self, signal: Dict[str, Any]) -> Tuple[bool, str]:
+        with self._lock:
+            row = self._db.execute("SELECT prob, velocity FROM triggers WHERE market_id = ?", (signal["market_id"],)).fetchone()
+        if row is None:
+            return True, "first"
+        prob, velocity = row
+        if signal["crossings"]:
+            return True, "crossing " + ",".join(f"{c['direction']}@{c['level']}" for c in signal["crossings"])
+        if abs(signal["velocity"] - velocity) >= self.retrigger_dv:
+            return True, f"velocity {velocity:+.3f}->{signal['velocity']:+.3f}/h"
+        if abs(signal["prob"] - prob) >= self.retrigger_dp:
+            return True, f"prob {prob:.2f}->{signal['prob']:.2f}"
+        return False, "unchanged"
+
+    def mark_triggered(self, signal: Dict[str, Any]) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO triggers (market_id, ts, prob, velocity) VALUES (?, ?, ?, ?)",
+                (signal["market_id"], time.time(), signal["prob"], signal["velocity"]),
+            )
+            self._db.commit()
+
+    def history(self, market_id: str) -> Dict[str, Any]:
+        with self._lock:
+            outcomes = [r[0] for r in self._db.execute("SELECT outcome FROM ring_heads WHERE market_id = ?", (market_id,))]
+            out = {}
+            for o in outcomes:
+                ts, ps, _ = self._last(market_id, o, self.capacity)
+                out[o] = [[round(t, 3), p] for t, p in zip(ts, ps)]
+        return {"market_id": market_id, "series": out}
+
+
+_tracker: Optional[MomentumTracker] = None
+
+
+def get_tracker() -> MomentumTracker:
+    global _tracker
+    if _tracker is None:
+        _tracker = MomentumTracker()
+    return _tracker
@@ -2,13 +2,29 @@ from __future__ import annotations
 
 import os
 import json
-from typing import Any, Dict, Optional
-from openai import OpenAI
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar, Union
 import base64
 import uuid
 from pathlib import Path
 
+from backend import tracing
+from backend.config import env_float
+from backend.assets import precompress
+
+T = TypeVar("T")
+Models = Union[str, Sequence[str]]
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
 def _client() -> OpenAI:
+    # openai is imported on first call, not at app startup
+    from openai import OpenAI
+
     api_key = os.getenv("OPENROUTER_API_KEY")
     if not api_key:
         raise RuntimeError("Missing OPENROUTER_API_KEY")
@@ -22,10 +38,192 @@ def _client() -> OpenAI:
         },
     )
 
-def call_json(model: str, system: str, user: str) -> Dict[str, Any]:
+# ---- routing: rolling per-model latency/error stats, candidate selection, hedging
+
+class _ModelStats:
+    def __init__(self, window: int):
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.outcomes: Deque[bool] = deque(maxlen=window)  # True = error
+        self.calls = 0
+        self.errors = 0
+        self.hedged_wins = 0
+
+    def error_rate(self) -> float:
+        return (sum(self.outcomes) / len(self.outcomes)) if self.outcomes else 0.0
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        xs = sorted(self.latencies)
+        return xs[min(len(xs) - 1, int(q * len(xs)))]
+
+
+_stats: Dict[str, _ModelStats] = {}
+_stats_lock = threading.RLock()
+_hedge_pool = ThreadPoolExecutor(max_workers=int(env_float("OR_HEDGE_WORKERS", 16)), thread_name_prefix="or-hedge")
+
+
+def _model_stats(model: str) -> _ModelStats:
+    with _stats_lock:
+        st = _stats.get(model)
+        if st is None:
+            st = _stats[model] = _ModelStats(int(env_float("OR_ROUTE_WINDOW", 200)))
+        return st
+
+
+def _record(model: str, seconds: float, error: bool) -> None:
+    st = _model_stats(model)
+    with _stats_lock:
+        st.calls += 1
+        st.outcomes.append(error)
+        if error:
+            st.errors += 1
+        else:
+            st.latencies.append(seconds)
+
+
+def _timed(model: str, fn: Callable[[], T]) -> T:
+    with tracing.span("llm.attempt", tracing.KIND_CLIENT, **{"llm.model": model}):
+        t0 = time.monotonic()
+        try:
+            out = fn()
+        except Exception:
+            _record(model, time.monotonic() - t0, error=True)
+            raise
+        _record(model, time.monotonic() - t0, error=False)
+        return out
+
+
+def model_candidates(env_var: str, default: str) -> List[str]:
     """
-    Uses OpenRouter via OpenAI-compatible chat completions. :contentReference[oaicite:2]{index=2}
+    Ordered candidate list for a node, e.g. OR_TEXT_MODEL="openai/gpt-4o-mini,google/gemini-2.0-flash-001".
+    A single model keeps the old behaviour.
     """
+    raw = os.getenv(env_var, default)
+    models = [m.strip() for m in raw.split(",") if m.strip()]
+    return models or [default]
+
+
+def _ranked(models: Models) -> List[str]:
+    """
+    Candidates in preference order with unhealthy ones moved to the back.
+
+    A model is unhealthy when, over at least OR_ROUTE_MIN_SAMPLES recent calls, its error rate
+    exceeds OR_ROUTE_MAX_ERROR_RATE. A healthy model is demoted behind a faster one when its
+    p95 is more than OR_ROUTE_SLOW_FACTOR times the fastest healthy p95.
+    """
+    if isinstance(models, str):
+        return [models]
+    models = list(models)
+    min_samples = int(env_float("OR_ROUTE_MIN_SAMPLES", 10))
+    max_err = env_float("OR_ROUTE_MAX_ERROR_RATE", 0.5)
+    slow_factor = env_float("OR_ROUTE_SLOW_FACTOR", 2.0)
+
+    healthy, unhealthy = [], []
+    for m in models:
+        st = _model_stats(m)
+        if len(st.outcomes) >= min_samples and st.error_rate() > max_err:
+            unhealthy.append(m)
+        else:
+            healthy.append(m)
+
+    p95s = {m: _model_stats(m).quantile(0.95) for m in healthy if len(_model_stats(m).latencies) >= min_samples}
+    if p95s:
+        fastest = min(p95s.values())
+        slow = [m for m in healthy if p95s.get(m, 0.0) > slow_factor * fastest]
+        healthy = [m for m in healthy if m not in slow] + slow
+    return healthy + unhealthy
+
+
+def pick_model(models: Models) -> str:
+    return _ranked(models)[0]
+
+
+def _hedge_delay(model: str) -> float:
+    st = _model_stats(model)
+    if len(st.latencies) >= int(env_float("OR_ROUTE_MIN_SAMPLES", 10)):
+        return st.quantile(0.95) or 0.0
+    return env_float("OR_HEDGE_AFTER_S", 10.0)
+
+
+def _route(models: Models, fn: Callable[[str], T], hedge: bool) -> T:
+    """
+    Runs fn(model) on the best candidate. With hedging on and a second candidate available,
+    if the primary hasn't answered within its p95 the runner-up is fired too and whichever
+    succeeds first wins. Falls through to the next candidate on errors.
+    """
+    ranked = _ranked(models)
+    call = tracing.current()
+    if not hedge or len(ranked) < 2:
+        last_exc: Optional[BaseException] = None
+        for n, m in enumerate(ranked, 1):
+            try:
+                out = _timed(m, lambda: fn(m))
+                call.set(**{"llm.model": m, "llm.attempts": n, "llm.retries": n - 1})
+                return out
+            except Exception as e:
+                last_exc = e
+        call.set(**{"llm.attempts": len(ranked), "llm.retries": len(ranked) - 1})
+        assert last_exc is not None
+        raise last_exc
+
+    pending: Dict[Future, str] = {}
+    queue = list(ranked)
+    launched = 0
+
+    def launch() -> None:
+        nonlocal launched
+        m = queue.pop(0)
+        launched += 1
+        pending[_hedge_pool.submit(tracing.bind(_timed), m, lambda: fn(m))] = m
+
+    launch()
+    first = next(iter(pending.values()))
+    timeout: Optional[float] = _hedge_delay(first)
+    last_exc = None
+    while pending:
+        done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            # primary is past its p95: hedge with the next candidate, then wait for either
+            if queue:
+                launch()
+            timeout = None
+            continue
+        for fut in done:
+            m = pending.pop(fut)
+            exc = fut.exception()
+            if exc is None:
+                if m != first:
+                    with _stats_lock:
+                        _model_stats(m).hedged_wins += 1
+                call.set(**{"llm.model": m, "llm.attempts": launched, "llm.retries": launched - 1, "llm.hedge_won": m != first})
+                return fut.result()
+            last_exc = exc
+        if not pending and queue:
+            launch()
+            timeout = None
+    call.set(**{"llm.attempts": launched, "llm.retries": launched - 1})
+    assert last_exc is not None
+    raise last_exc
+
+
+def model_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        items = list(_stats.items())
+    return {
+        m: {
+            "calls": st.calls,
+            "errors": st.errors,
+            "error_rate": round(st.error_rate(), 4),
+            "p50_s": st.quantile(0.50),
+            "p95_s": st.quantile(0.95),
+            "hedged_wins": st.hedged_wins,
+        }
+        for m, st in items
+    }
+
+
+def _chat_json(model: str, system: str, user: str) -> Dict[str, Any]:
     client = _client()
     resp = client.chat.completions.create(
         model=model,
@@ -37,9 +235,174 @@ def call_json(model: str, system: str, user: str) -> Dict[str, Any]:
         temperature=0.2,
     )
     content = resp.choices[0].message.content or "{}"
+    tracing.current().set(**{"response.bytes": len(content)})
     return json.loads(content)
 
-def call_image_data_url(model: str, prompt: str) -> str:
+
+def call_json(model: Models, system: str, user: str, hedge: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    Uses OpenRouter via OpenAI-compatible chat completions. :contentReference[oaicite:2]{index=2}
+    `model` may be a single model or an ordered candidate list (see model_candidates);
+    hedging defaults to OR_HEDGE=1.
+    """
+    if hedge is None:
+        hedge = os.getenv("OR_HEDGE", "0") == "1"
+    attrs = {"llm.candidates": _ranked(model), "llm.hedge": hedge, "request.bytes": len(system) + len(user)}
+    with tracing.span("llm.call_json", tracing.KIND_CLIENT, **attrs):
+        return _route(model, lambda m: _chat_json(m, system, user), hedge=hedge)
+
+
+def iter_array_items(chunks: Iterable[str], key: str) -> Iterator[Any]:
+    """
+    Incrementally scans streamed JSON text and yields each element of the top-level
+    array `key` as soon as it closes, e.g. every idea of {"ideas": [{...}, {...}]}.
+    Only a key of the outermost object counts, not one in a nested object or a string.
+    Only the element itself is passed to json.loads; the rest of the document is skipped.
+    """
+    buf = ""
+    pos = 0            # next unscanned index in buf
+    in_array = False
+    depth = 0          # before the array: document depth (1 = in the outer object); in it: 1 = directly in it
+    in_str = False
+    escape = False
+    start = -1         # where the current element (or, before the array, the current string) began
+    expect = ""        # after the key: ":" then "["
+
+    for chunk in chunks:
+        buf += chunk
+        while pos < len(buf):
+            c = buf[pos]
+            if not in_array:
+                if in_str:
+                    if escape:
+                        escape = False
+                    elif c == "\\":
+                        escape = True
+                    elif c == '"':
+                        in_str = False
+                        if depth == 1 and json.loads(buf[start : pos + 1]) == key:
+                            expect = ":"
+                        start = -1
+                elif c in " \t\r\n":
+                    pass
+                elif expect == ":" and c == ":":
+                    expect = "["
+                elif expect == "[" and c == "[":
+                    in_array, depth, expect = True, 1, ""
+                else:
+                    expect = ""
+                    if c == '"':
+                        in_str = True
+                        start = pos
+                    elif c in "{[":
+                        depth += 1
+                    elif c in "}]":
+                        depth -= 1
+                pos += 1
+                continue
+
+            if in_str:
+                if escape:
+                    escape = False
+                elif c == "\\":
+                    escape = True
+                elif c == '"':
+                    in_str = False
+                    if depth == 1 and start >= 0 and buf[start] == '"':
+                        yield json.loads(buf[start : pos + 1])
+                        start = -1
+            elif c == '"':
+                in_str = True
+                if depth == 1:
+                    start = pos
+            elif c in "{[":
+                if depth == 1:
+                    start = pos
+                depth += 1
+            elif c in "}]":
+                depth -= 1
+                if depth == 0:
+                    return  # end of the array
+                if depth == 1 and start >= 0:
+                    yield json.loads(buf[start : pos + 1])
+                    start = -1
+            elif depth == 1 and c not in " \t\r\n,":
+                # scalar element (number / true / false / null): read to the next delimiter
+                end = pos
+                while end < len(buf) and buf[end] not in ",]} \t\r\n":
+                    end += 1
+                if end == len(buf):
+                    break  # may continue in the next chunk
+                yield json.loads(buf[pos:end])
+                pos = end
+                continue
+            pos += 1
+
+        # drop everything before the current element (or key) so buf doesn't grow with the response
+        cut = start if start >= 0 else pos
+        buf, pos = buf[cut:], pos - cut
+        if start >= 0:
+            start = 0
+
+
+def _chat_json_stream(model: str, system: str, user: str) -> Iterator[str]:
+    client = _client()
+    stream = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": system},
+            {"role": "user", "content": user},
+        ],
+        response_format={"type": "json_object"},
+        temperature=0.2,
+        stream=True,
+    )
+    for event in stream:
+        if event.choices:
+            delta = event.choices[0].delta.content
+            if delta:
+                yield delta
+
+
+def call_json_stream(model: Models, system: str, user: str, key: str) -> Iterator[Dict[str, Any]]:
+    """
+    Streaming variant of call_json: yields each element of the array `key` as it completes,
+    so callers can start work on the first items while the rest are still being generated.
+    Routed to the best candidate but never hedged (a stream is consumed as it arrives).
+    """
+    m = pick_model(model)
+    t0 = time.monotonic()
+    start_ns = time.time_ns()
+    items = 0
+    # recorded as a finished span: the consumer's own spans run between our yields
+    attrs = {"llm.model": m, "llm.stream_key": key, "request.bytes": len(system) + len(user)}
+    try:
+        for item in iter_array_items(_chat_json_stream(m, system, user), key):
+            items += 1
+            yield item
+    except Exception as e:
+        _record(m, time.monotonic() - t0, error=True)
+        tracing.add_span("llm.call_json_stream", start_ns, time.time_ns(), tracing.KIND_CLIENT, error=e, **attrs, **{"llm.items": items})
+        raise
+    _record(m, time.monotonic() - t0, error=False)
+    tracing.add_span("llm.call_json_stream", start_ns, time.time_ns(), tracing.KIND_CLIENT, **attrs, **{"llm.items": items})
+
+
+def call_image(model: Models, prompt: str, hedge: Optional[bool] = None) -> Tuple[str, str]:
+    """Routed image call over the candidates; returns (model that answered, data URL)."""
+    # hedging an image call can pay for two images, so it has its own switch
+    if hedge is None:
+        hedge = os.getenv("OR_HEDGE_IMAGES", "0") == "1"
+    attrs = {"llm.candidates": _ranked(model), "llm.hedge": hedge, "request.bytes": len(prompt)}
+    with tracing.span("llm.image", tracing.KIND_CLIENT, **attrs):
+        return _route(model, lambda m: (m, _image_data_url(m, prompt)), hedge=hedge)
+
+
+def call_image_data_url(model: Models, prompt: str, hedge: Optional[bool] = None) -> str:
+    return call_image(model, prompt, hedge=hedge)[1]
+
+
+def _image_data_url(model: str, prompt: str) -> str:
     client = _client()
 
     resp = client.chat.completions.create(
@@ -55,7 +418,9 @@ def call_image_data_url(model: str, prompt: str) -> str:
 
     # OpenRouter returns dict-like objects here
     first = images[0]
-    return first["image_url"]["url"]
+    url = first["image_url"]["url"]
+    tracing.current().set(**{"response.bytes": len(url)})
+    return url
 
 def save_data_url(data_url: str, out_dir: str | Path) -> str:
     """
@@ -76,4 +441,6 @@ def save_data_url(data_url: str, out_dir: str | Path) -> str:
     file_path = out_dir / filename
 
     file_path.write_bytes(base64.b64decode(b64))
+    # a no-op for the png/jpeg/webp the image models return; only text-like types get .gz/.br siblings
+    precompress(file_path)
     return f"/generated/{filename}"
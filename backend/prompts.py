@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import json
+import threading
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+
+from pydantic import BaseModel
+
+# Every prompt is laid out most-stable-first so provider-side prefix caching can reuse it:
+#   system: the agent's fixed instructions (identical on every call of a node)
+#   user:   market context, then the per-call payload as compact canonical JSON
+# The system prompt differs per node and comes first, so the cached prefix is per node:
+# repeat calls of one node reuse its instructions, and for the same market (e.g. per-idea
+# risk calls, retries, fallbacks) the market context too. Nodes don't share a prefix.
+# Nothing that varies per call (ids, timestamps, model reprs) goes ahead of the stable parts.
+
+
+def canonical(obj: Any) -> str:
+    """Compact, key-sorted JSON: the same payload always serializes to the same bytes."""
+    return json.dumps(_plain(obj), separators=(",", ":"), sort_keys=True, ensure_ascii=False)
+
+
+def _plain(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        # unset defaults and None fields carry no information for the model
+        return _plain(obj.model_dump(exclude_none=True, exclude_defaults=True))
+    if isinstance(obj, dict):
+        return {k: _plain(v) for k, v in obj.items() if v not in (None, "", [], {})}
+    if isinstance(obj, (list, tuple)):
+        return [_plain(v) for v in obj]
+    return obj
+
+
+def market_context(name: str, category: str) -> str:
+    return f"Market: {name}\nCategory: {category}"
+
+
+def build(node: str, system: str, context: str, payload: Optional[Dict[str, Any]] = None, note: str = "") -> Tuple[str, str]:
+    """Returns (system, user) for one call and records its size under `node`."""
+    parts = [context]
+    if note:
+        parts.append(note)
+    if payload is not None:
+        parts.append(canonical(payload))
+    user = "\n".join(parts)
+    _stats.record(node, system, user)
+    return system, user
+
+
+# ---- token accounting
+
+@lru_cache(maxsize=1)
+def _encoding() -> Any:
+    """
+    tiktoken's o200k_base, or None. Loaded on first use, not at import: the BPE table takes
+    a while to build and may have to be downloaded, which startup shouldn't wait on.
+    """
+    try:  # optional: exact counts when tiktoken is installed
+        import tiktoken
+
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:  # pragma: no cover - depends on the environment
+        return None
+
+
+def count_tokens(text: str) -> int:
+    enc = _encoding()
+    if enc is not None:
+        return len(enc.encode(text))
+    # ~4 chars per token for English/JSON; good enough to compare layouts
+    return (len(text) + 3) // 4
+
+
+def tokenizer() -> str:
+    return "tiktoken:o200k_base" if _encoding() is not None else "estimate:chars/4"
+
+
+class _PromptStats:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._nodes: Dict[str, Dict[str, int]] = {}
+
+    def record(self, node: str, system: str, user: str) -> None:
+        s, u = count_tokens(system), count_tokens(user)
+        with self._lock:
+            n = self._nodes.setdefault(node, {"calls": 0, "system_tokens": 0, "user_tokens": 0})
+            n["calls"] += 1
+            n["system_tokens"] += s
+            n["user_tokens"] += u
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            nodes = {k: dict(v) for k, v in self._nodes.items()}
+        for v in nodes.values():
+            v["input_tokens_per_call"] = round((v["system_tokens"] + v["user_tokens"]) / max(1, v["calls"]), 1)
+        return {"tokenizer": tokenizer(), "nodes": nodes}
+
+
+_stats = _PromptStats()
+
+
+def prompt_stats() -> Dict[str, Any]:
+    return _stats.snapshot()
@@ -1,7 +1,6 @@
 from __future__ import annotations
 
 import os
-import requests
 from fastapi import APIRouter
 
 router = APIRouter()
@@ -41,6 +40,8 @@ def shopify_ping():
     query = "query { shop { name myshopifyDomain } }"
 
     try:
+        import requests
+
         r = requests.post(url, headers=headers, json={"query": query}, timeout=20)
         ct = (r.headers.get("content-type") or "").lower()
 
@@ -2,50 +2,166 @@ from __future__ import annotations
 
 import os
 import mimetypes
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
-import requests
+from backend import tracing
+from backend.config import env_float, env_int
 
 
-def _shopify_endpoint() -> str:
-    domain = os.getenv("SHOPIFY_STORE_DOMAIN", "").strip()
-    version = os.getenv("SHOPIFY_API_VERSION", "2026-01").strip()
-    if not domain:
-        raise RuntimeError("Missing SHOPIFY_STORE_DOMAIN")
-    return f"https://{domain}/admin/api/{version}/graphql.json"
+def _http():
+    # requests is imported on first use, not at app startup
+    import requests
 
+    return requests
 
-def _shopify_headers() -> Dict[str, str]:
-    token = os.getenv("SHOPIFY_ACCESS_TOKEN", "").strip()
-    if not token:
-        raise RuntimeError("Missing SHOPIFY_ACCESS_TOKEN")
-    return {
-        "Content-Type": "application/json",
-        "X-Shopify-Access-Token": token,
-    }
 
+class ShopifyStore:
+    """
+    One storefront: credentials, its own HTTP connection pool and a token-bucket
+    request budget, so a slow or throttled store never eats another store's budget.
+    """
+
+    def __init__(self, name: str, domain: str, token: str, api_version: str = "2026-01", rps: float = 10.0, burst: int = 40, pool_size: int = 8):
+        self.name = name
+        self.domain = domain.strip()
+        self.token = token.strip()
+        self.api_version = api_version.strip()
+        self.rps = rps
+        self.burst = burst
+        self.pool_size = pool_size
+
+        self._session = None
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._refilled = time.monotonic()
+
+    @classmethod
+    def from_env(cls, name: str, prefix: str) -> "ShopifyStore":
+        # prefix "SHOPIFY" reads SHOPIFY_STORE_DOMAIN / SHOPIFY_ACCESS_TOKEN (the single-store setup),
+        # prefix "SHOPIFY_EU" reads SHOPIFY_EU_STORE_DOMAIN / SHOPIFY_EU_ACCESS_TOKEN, and so on
+        def env(key: str, default: str = "") -> str:
+            return os.getenv(f"{prefix}_{key}", default)
+
+        return cls(
+            name=name,
+            domain=env("STORE_DOMAIN"),
+            token=env("ACCESS_TOKEN"),
+            api_version=env("API_VERSION", os.getenv("SHOPIFY_API_VERSION", "2026-01")),
+            rps=env_float(f"{prefix}_RPS", 10.0),
+            burst=env_int(f"{prefix}_BURST", 40),
+            pool_size=env_int(f"{prefix}_POOL_SIZE", 8),
+        )
+
+    def endpoint(self) -> str:
+        if not self.domain:
+            raise RuntimeError(f"Missing SHOPIFY_STORE_DOMAIN for store {self.name!r}")
+        return f"https://{self.domain}/admin/api/{self.api_version}/graphql.json"
+
+    def headers(self) -> Dict[str, str]:
+        if not self.token:
+            raise RuntimeError(f"Missing SHOPIFY_ACCESS_TOKEN for store {self.name!r}")
+        return {
+            "Content-Type": "application/json",
+            "X-Shopify-Access-Token": self.token,
+        }
+
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                http = _http()
+                sess = http.Session()
+                adapter = http.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                sess.mount("https://", adapter)
+                self._session = sess
+            return self._session
+
+    def acquire(self) -> None:
+        """Blocks until this store's request budget allows one more call."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rps)
+                self._refilled = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rps
+            time.sleep(wait)
+
+
+_stores: Optional[Dict[str, ShopifyStore]] = None
+_stores_lock = threading.Lock()
+
+
+def get_stores() -> Dict[str, ShopifyStore]:
+    """
+    SHOPIFY_STORES="us,eu" registers one store per name from SHOPIFY_<NAME>_* env vars
+    (STORE_DOMAIN, ACCESS_TOKEN, API_VERSION, RPS, BURST, POOL_SIZE). Without it there is
+    a single "default" store read from the original SHOPIFY_STORE_DOMAIN / SHOPIFY_ACCESS_TOKEN.
+    """
+    global _stores
+    with _stores_lock:
+        if _stores is None:
+            names = [n.strip() for n in os.getenv("SHOPIFY_STORES", "").split(",") if n.strip()]
+            if names:
+                _stores = {n: ShopifyStore.from_env(n, f"SHOPIFY_{n.upper()}") for n in names}
+            else:
+                _stores = {"default": ShopifyStore.from_env("default", "SHOPIFY")}
+        return _stores
+
+
+def reload_stores() -> Dict[str, ShopifyStore]:
+    global _stores
+    with _stores_lock:
+        _stores = None
+    return get_stores()
+
+
+def _default_store() -> ShopifyStore:
+    return next(iter(get_stores().values()))
+
+
+def _operation(query: str) -> str:
+    # "mutation productCreate($product: ...)" -> "productCreate"
+    head = query.strip().split("(", 1)[0].split()
+    return head[1] if len(head) > 1 else (head[0] if head else "")
+
+
+def _graphql(query: str, variables: Dict[str, Any] | None = None, store: Optional[ShopifyStore] = None) -> Dict[str, Any]:
+    store = store or _default_store()
+    with tracing.span("shopify.graphql", tracing.KIND_CLIENT, **{"shopify.store": store.name, "shopify.operation": _operation(query)}) as sp:
+        t0 = time.monotonic()
+        store.acquire()
+        sp.set(**{"shopify.throttle_wait_ms": round((time.monotonic() - t0) * 1000, 3)})
+        resp = store.session().post(
+            store.endpoint(),
+            headers=store.headers(),
+            json={"query": query, "variables": variables or {}},
+            timeout=30,
+        )
+        sp.set(**{"http.status_code": resp.status_code, "response.bytes": len(resp.content)})
 
-def _graphql(query: str, variables: Dict[str, Any] | None = None) -> Dict[str, Any]:
-    resp = requests.post(
-        _shopify_endpoint(),
-        headers=_shopify_headers(),
-        json={"query": query, "variables": variables or {}},
-        timeout=30,
-    )
+        try:
+            payload = resp.json()
+        except Exception as e:
+            raise RuntimeError(f"Shopify non-JSON response: {resp.status_code} {resp.text[:200]}") from e
 
-    try:
-        payload = resp.json()
-    except Exception as e:
-        raise RuntimeError(f"Shopify non-JSON response: {resp.status_code} {resp.text[:200]}") from e
+        # Shopify's own query-cost budget, when it reports one
+        throttle = ((payload.get("extensions") or {}).get("cost") or {}).get("throttleStatus") or {}
+        if throttle:
+            sp.set(**{"shopify.cost_available": throttle.get("currentlyAvailable")})
 
-    if resp.status_code >= 400:
-        raise RuntimeError(f"Shopify HTTP {resp.status_code}: {payload}")
+        if resp.status_code >= 400:
+            raise RuntimeError(f"Shopify HTTP {resp.status_code}: {payload}")
 
-    if payload.get("errors"):
-        raise RuntimeError(f"Shopify GraphQL errors: {payload['errors']}")
+        if payload.get("errors"):
+            raise RuntimeError(f"Shopify GraphQL errors: {payload['errors']}")
 
-    return payload.get("data") or {}
+        return payload.get("data") or {}
 
 
 PRODUCT_CREATE = """
@@ -132,6 +248,9 @@ def _resolve_local_image_path(image_data_url: str) -> Optional[Path]:
         return None
 
     if image_data_url.startswith("/generated/"):
+        generated = os.getenv("GENERATED_DIR")
+        if generated:
+            return Path(generated) / image_data_url[len("/generated/"):]
         p = _project_root() / image_data_url.lstrip("/")
         return p
 
@@ -143,7 +262,7 @@ def _resolve_local_image_path(image_data_url: str) -> Optional[Path]:
     return None
 
 
-def _staged_upload_product_image(local_path: Path) -> str:
+def _staged_upload_product_image(local_path: Path, store: Optional[ShopifyStore] = None) -> str:
     if not local_path.exists():
         raise FileNotFoundError(f"Image not found: {local_path}")
 
@@ -159,7 +278,7 @@ def _staged_upload_product_image(local_path: Path) -> str:
             }
         ]
     }
-    data = _graphql(STAGED_UPLOADS_CREATE, variables)
+    data = _graphql(STAGED_UPLOADS_CREATE, variables, store=store)
     out = data.get("stagedUploadsCreate") or {}
     errs = out.get("userErrors") or []
     if errs:
@@ -174,16 +293,19 @@ def _staged_upload_product_image(local_path: Path) -> str:
     resource_url = target["resourceUrl"]
     params = {kv["name"]: kv["value"] for kv in (target.get("parameters") or [])}
 
-    with local_path.open("rb") as f:
-        files = {"file": (local_path.name, f, mime_type)}
-        r = requests.post(upload_url, data=params, files=files, timeout=90)
-        r.raise_for_status()
+    size = local_path.stat().st_size
+    with tracing.span("shopify.staged_upload", tracing.KIND_CLIENT, **{"request.bytes": size, "file.name": local_path.name}) as sp:
+        with local_path.open("rb") as f:
+            files = {"file": (local_path.name, f, mime_type)}
+            r = (store or _default_store()).session().post(upload_url, data=params, files=files, timeout=90)
+            sp.set(**{"http.status_code": r.status_code})
+            r.raise_for_status()
 
     return resource_url
 
 
-def _attach_image_to_product(product_id: str, local_path: Path, alt: str) -> Dict[str, Any]:
-    resource_url = _staged_upload_product_image(local_path)
+def _attach_image_to_product(product_id: str, local_path: Path, alt: str, store: Optional[ShopifyStore] = None) -> Dict[str, Any]:
+    resource_url = _staged_upload_product_image(local_path, store=store)
 
     variables = {
         "product": {"id": product_id},
@@ -195,7 +317,7 @@ def _attach_image_to_product(product_id: str, local_path: Path, alt: str) -> Dic
             }
         ],
     }
-    data = _graphql(PRODUCT_UPDATE_ADD_MEDIA, variables)
+    data = _graphql(PRODUCT_UPDATE_ADD_MEDIA, variables, store=store)
     pu = data.get("productUpdate") or {}
     errs = pu.get("userErrors") or []
     if errs:
@@ -204,7 +326,7 @@ def _attach_image_to_product(product_id: str, local_path: Path, alt: str) -> Dic
     return pu
 
 
-def create_products(products: List[Dict[str, Any]]) -> Dict[str, Any]:
+def create_products(products: List[Dict[str, Any]], store: Optional[ShopifyStore] = None) -> Dict[str, Any]:
     """
     Expected product dict keys from your pipeline:
       title: str
@@ -231,7 +353,7 @@ def create_products(products: List[Dict[str, Any]]) -> Dict[str, Any]:
                 "tags": p.get("tags") or [],
                 "status": "ACTIVE",
             }
-            data = _graphql(PRODUCT_CREATE, {"product": product_input})
+            data = _graphql(PRODUCT_CREATE, {"product": product_input}, store=store)
             pc = data.get("productCreate") or {}
             user_errors = pc.get("userErrors") or []
             if user_errors:
@@ -253,6 +375,7 @@ def create_products(products: List[Dict[str, Any]]) -> Dict[str, Any]:
             data2 = _graphql(
                 VARIANTS_BULK_UPDATE,
                 {"productId": product_id, "variants": [{"id": variant_id, "price": price_str}]},
+                store=store,
             )
             vbu = data2.get("productVariantsBulkUpdate") or {}
             v_errors = vbu.get("userErrors") or []
@@ -267,14 +390,14 @@ def create_products(products: List[Dict[str, Any]]) -> Dict[str, Any]:
                 image_data_url = p.get("image_data_url") or ""
                 local_path = _resolve_local_image_path(image_data_url)
                 if local_path:
-                    media_result = _attach_image_to_product(product_id, local_path, alt=title)
+                    media_result = _attach_image_to_product(product_id, local_path, alt=title, store=store)
             except Exception as e:
                 media_error = str(e)
 
             # 3) Publish (keep it, even if it errors)
             publish_errors = None
             try:
-                data3 = _graphql(PUBLISH_TO_CURRENT_CHANNEL, {"id": product_id})
+                data3 = _graphql(PUBLISH_TO_CURRENT_CHANNEL, {"id": product_id}, store=store)
                 pub = data3.get("publishablePublishToCurrentChannel") or {}
                 publish_errors = pub.get("userErrors") or []
             except Exception as e:
@@ -295,4 +418,46 @@ def create_products(products: List[Dict[str, Any]]) -> Dict[str, Any]:
         except Exception as e:
             errors.append({"stage": "exception", "title": title, "error": str(e)})
 
-    return {"mode": mode, "created": created, "errors": errors}
\ No newline at end of file
+    return {"mode": mode, "created": created, "errors": errors}
+
+
+def create_products_in_stores(products: List[Dict[str, Any]], stores: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Publishes the same products to several stores concurrently (all registered stores by default).
+    Each store runs create_products on its own thread, pool and budget; a store that fails
+    outright is reported under its name and doesn't affect the others.
+
+    Returns the create_products shape with created/errors flattened across stores (each entry
+    tagged with "store") plus per-store results under "stores".
+    """
+    registry = get_stores()
+    names = stores or list(registry)
+    mode = os.getenv("SHOPIFY_MODE", "real")
+
+    def one(name: str) -> Dict[str, Any]:
+        store = registry.get(name)
+        if store is None:
+            return {"mode": mode, "created": [], "errors": [{"stage": "store", "title": None, "error": f"Unknown store {name!r}"}]}
+        with tracing.span("shopify.store", **{"shopify.store": name, "products": len(products)}) as sp:
+            try:
+                out = create_products(products, store=store)
+            except Exception as e:
+                sp.fail(e)
+                return {"mode": mode, "created": [], "errors": [{"stage": "store", "title": None, "error": str(e)}]}
+            sp.set(created=len(out.get("created", [])), errors=len(out.get("errors", [])))
+            return out
+
+    if len(names) == 1:
+        per_store = {names[0]: one(names[0])}
+    else:
+        with ThreadPoolExecutor(max_workers=len(names), thread_name_prefix="shopify-store") as pool:
+            # one context copy per task: a copied context can't be entered by two threads at once
+            futures = [pool.submit(tracing.bind(one), n) for n in names]
+            per_store = dict(zip(names, (f.result() for f in futures)))
+
+    return {
+        "mode": mode,
+        "created": [{**c, "store": n} for n, r in per_store.items() for c in r.get("created", [])],
+        "errors": [{**e, "store": n} for n, r in per_store.items() for e in r.get("errors", [])],
+        "stores": per_store,
+    }
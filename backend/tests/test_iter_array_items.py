@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from backend.openrouter_client import iter_array_items
+
+
+def chunked(text, size):
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+DOC = {
+    "note": 'mentions "ideas": [1, 2] and a \\" quote',
+    "meta": {"ideas": ["nested", "not these"]},
+    "lists": [["ideas"], {"ideas": [0]}],
+    "ideas": [
+        {"title": 'brace } and bracket ] in "text"', "tags": ["a", ["b", {"c": []}]]},
+        "plain \\ string with é and \"quotes\"",
+        [1, [2, [3]]],
+        -1.5e3,
+        True,
+        None,
+        {},
+    ],
+    "after": {"ideas": ["ignored"]},
+}
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 64, 100_000])
+def test_yields_top_level_items_across_chunk_boundaries(size):
+    text = json.dumps(DOC, indent=2)
+    assert list(iter_array_items(chunked(text, size), "ideas")) == DOC["ideas"]
+
+
+@pytest.mark.parametrize("size", [1, 4, 100_000])
+def test_compact_json(size):
+    text = json.dumps(DOC, separators=(",", ":"))
+    assert list(iter_array_items(chunked(text, size), "ideas")) == DOC["ideas"]
+
+
+def test_key_only_in_nested_object_yields_nothing():
+    text = json.dumps({"meta": {"ideas": [1, 2]}, "other": [{"ideas": [3]}]})
+    assert list(iter_array_items(chunked(text, 3), "ideas")) == []
+
+
+def test_key_inside_string_values_is_ignored():
+    text = json.dumps({"a": '{"ideas": [1]}', "b": "ideas", "ideas": [2]})
+    assert list(iter_array_items(chunked(text, 2), "ideas")) == [2]
+
+
+def test_key_whose_value_is_not_an_array_is_skipped():
+    text = '{"ideas": "none yet", "x": {"ideas": [0]}, "ideas": [4, 5]}'
+    assert list(iter_array_items(chunked(text, 1), "ideas")) == [4, 5]
+
+
+def test_escaped_key_and_markdown_fence():
+    text = '```json\n{"id\\u0065as": [{"t": "a\\\\"}, "b\\"]"]}\n```'
+    assert list(iter_array_items(chunked(text, 1), "ideas")) == [{"t": "a\\"}, 'b"]']
+
+
+def test_items_are_yielded_before_the_array_closes():
+    # a truncated stream: 3 might still become 30, so it waits for a delimiter
+    parts = ['{"ideas": [{"n": 1}, ', '{"n": 2}', ", 3"]
+    assert list(iter_array_items(parts, "ideas")) == [{"n": 1}, {"n": 2}]
@@ -0,0 +1,67 @@
+import multiprocessing
+import os
+import signal
+import time
+
+import pytest
+
+from backend.bench.stubs import Latency, stub_backends
+from backend.polymarket import get_mock_markets
+from backend.worker import JobQueue, run_worker
+
+
+@pytest.fixture
+def queue_env(tmp_path, monkeypatch):
+    for name, file in {
+        "WORKER_QUEUE_PATH": "queue.sqlite3",
+        "IMAGE_CACHE_PATH": "image_cache.sqlite3",
+        "PREFILTER_STATE_PATH": "prefilter_state.json",
+        "MOMENTUM_DB_PATH": "momentum.sqlite3",
+        "TRACE_DB_PATH": "traces.sqlite3",
+    }.items():
+        monkeypatch.setenv(name, str(tmp_path / file))
+    monkeypatch.setenv("GENERATED_DIR", str(tmp_path / "generated"))
+    monkeypatch.setenv("PREFILTER_MAX_LOWER", "0")
+    return tmp_path
+
+
+def _slow_worker(worker_id: str, lease_s: float) -> None:
+    # every LLM call hangs long enough for the test to kill us mid-job
+    slow = Latency("fixed:60")
+    with stub_backends(slow, slow, slow):
+        run_worker(worker_id, None, lease_s=lease_s, idle_exit_s=0.5)
+
+
+def _job(q: JobQueue, market_id: str):
+    return q._db.execute("SELECT status, owner, attempts FROM jobs WHERE market_id = ?", (market_id,)).fetchone()
+
+
+def test_job_of_killed_worker_is_re_leased_and_completed(queue_env):
+    market = next(m for m in get_mock_markets() if m["market_id"] == "m3")
+    lease_s = 1.5
+    q = JobQueue(lease_s=lease_s)
+    q.enqueue([market], num_shards=4)
+
+    ctx = multiprocessing.get_context("fork")
+    doomed = ctx.Process(target=_slow_worker, args=("doomed", lease_s))
+    doomed.start()
+    try:
+        deadline = time.monotonic() + 30
+        while _job(q, "m3")[0] != "leased":
+            assert time.monotonic() < deadline, "slow worker never claimed the job"
+            time.sleep(0.05)
+    finally:
+        os.kill(doomed.pid, signal.SIGKILL)
+        doomed.join()
+    assert _job(q, "m3")[:2] == ("leased", "doomed")
+
+    # the survivor starts while the dead worker's lease is still live; it must wait it out
+    zero = Latency("0")
+    with stub_backends(zero, zero, zero):
+        run_worker("survivor", None, lease_s=lease_s, idle_exit_s=0.2)
+
+    status, owner, attempts = _job(q, "m3")
+    assert status == "done"
+    assert owner is None
+    assert attempts == 2
+    assert q.outstanding() == 0
@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+import atexit
+import json
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from backend.config import env_float, streaming
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None  # type: ignore[assignment]
+
+# What one market costs once it gets past the prefilter: oracle, ideas and products LLM calls,
+# risk once for all ideas (once per idea when OR_STREAM=1 scores them as they stream in),
+# then up to 2 images (node_build_products keeps top 2). node_ideas asks for 5 ideas.
+IDEAS_PER_RUN = 5
+IMAGES_PER_RUN = 2
+
+
+def llm_calls_per_run() -> int:
+    return 3 + (IDEAS_PER_RUN if streaming() else 1)
+
+
+def _key(category: str) -> str:
+    return (category or "unknown").strip().lower()
+
+
+class ThresholdController:
+    """
+    Per-category prefilter thresholds driven by launch/reject feedback.
+
+    Outcomes are kept as exponentially decayed counts (half-life PREFILTER_HALF_LIFE_DAYS)
+    so old feedback fades. Categories that are mostly rejected get a higher threshold and,
+    past PREFILTER_SKIP_FLOOR rejection share, a probability of being skipped outright.
+    The skip probability is capped below 1 so a category can still earn its way back.
+    State is a small JSON file shared by both backends and all their workers; it is reloaded
+    when its mtime changes, and every read-modify-write holds an flock on <state>.lock.
+    Avoided-work counters are batched in memory and flushed every PREFILTER_FLUSH_S seconds
+    so decide() never touches the disk.
+    """
+
+    def __init__(self, path: Optional[str | Path] = None):
+        self.path = Path(path or os.getenv("PREFILTER_STATE_PATH", Path(__file__).with_name("prefilter_state.json")))
+        self.half_life_s = env_float("PREFILTER_HALF_LIFE_DAYS", 7.0) * 86400
+        self.prior_n = env_float("PREFILTER_PRIOR_N", 5.0)
+        self.max_raise = env_float("PREFILTER_MAX_RAISE", 0.20)
+        self.max_lower = env_float("PREFILTER_MAX_LOWER", 0.05)
+        self.skip_floor = env_float("PREFILTER_SKIP_FLOOR", 0.80)
+        self.max_skip = env_float("PREFILTER_MAX_SKIP", 0.90)
+        self.cost_per_llm_call = env_float("OR_COST_PER_LLM_CALL", 0.002)
+        self.cost_per_image = env_float("OR_COST_PER_IMAGE", 0.04)
+        self.flush_s = env_float("PREFILTER_FLUSH_S", 5.0)
+        # decide() checks the file for other workers' updates at most this often
+        self.reload_s = env_float("PREFILTER_RELOAD_S", 1.0)
+
+        self._lock = threading.Lock()
+        self._mtime = 0.0
+        self._checked = float("-inf")  # monotonic time of the last stat()
+        # category -> {"rejects", "launches", "ts"}
+        self._cats: Dict[str, Dict[str, float]] = {}
+        self._saved = {"skipped_runs": 0, "llm_calls": 0, "images": 0, "dollars": 0.0}
+        # avoided work not yet added to the file
+        self._pending = dict.fromkeys(self._saved, 0)
+        self._flush_timer: Optional[threading.Timer] = None
+        self._reload()
+
+    # ---- persistence
+
+    def _reload(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._checked < self.reload_s:
+            return
+        self._checked = now
+        try:
+            mtime = self.path.stat().st_mtime
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime and not force:
+            return
+        try:
+            data = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return
+        self._cats = data.get("categories", {})
+        self._saved.update(data.get("saved", {}))
+        self._mtime = mtime
+
+    @contextmanager
+    def _update(self) -> Iterator[None]:
+        """
+        Read-modify-write of the state file: the caller changes self._cats/_saved inside the
+        block, starting from what is on disk now, and the result is written back atomically.
+        Call with self._lock held.
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path.with_name(self.path.name + ".lock"), "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            # mtime can miss a write from the same tick, so always re-read under the lock
+            self._reload(force=True)
+            yield
+            self._save()
+
+    def _save(self) -> None:
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=self.path.name + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"categories": self._cats, "saved": self._saved}, f, indent=2)
+            os.replace(tmp, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        self._mtime = self.path.stat().st_mtime
+
+    # ---- counts
+
+    def _decayed(self, cat: str, now: float) -> Tuple[float, float]:
+        c = self._cats.get(cat)
+        if not c:
+            return 0.0, 0.0
+        f = math.pow(0.5, max(0.0, now - c["ts"]) / self.half_life_s) if self.half_life_s > 0 else 1.0
+        return c["rejects"] * f, c["launches"] * f
+
+    def _bump(self, category: str, rejects: float = 0.0, launches: float = 0.0) -> None:
+        now = time.time()
+        with self._lock, self._update():
+            cat = _key(category)
+            r, l = self._decayed(cat, now)
+            self._cats[cat] = {"rejects": r + rejects, "launches": l + launches, "ts": now}
+
+    def record_rejection(self, category: str, n: int = 1) -> None:
+        self._bump(category, rejects=n)
+
+    def record_launch(self, category: str, n: int = 1) -> None:
+        self._bump(category, launches=n)
+
+    def record_shopify_result(self, category: str, result: Dict[str, Any]) -> None:
+        # one product published to several stores is still one launch
+        created = len({c.get("title") for c in result.get("created") or []})
+        if created:
+            self.record_launch(category, created)
+
+    # ---- decisions
+
+    def _shape(self, category: str) -> Tuple[float, float]:
+        """(confidence, reject_share) for a category."""
+        self._reload()
+        r, l = self._decayed(_key(category), time.time())
+        n = r + l
+        confidence = n / (n + self.prior_n) if n > 0 else 0.0
+        reject_share = (r + 1.0) / (n + 2.0)
+        return confidence, reject_share
+
+    def threshold(self, category: str, base: float) -> float:
+        confidence, share = self._shape(category)
+        raise_by = self.max_raise * confidence * max(0.0, share - 0.5) * 2
+        lower_by = self.max_lower * confidence * max(0.0, 0.5 - share) * 2
+        return min(0.99, max(0.0, base + raise_by - lower_by))
+
+    def skip_probability(self, category: str) -> float:
+        confidence, share = self._shape(category)
+        if share <= self.skip_floor:
+            return 0.0
+        return self.max_skip * confidence * (share - self.skip_floor) / (1.0 - self.skip_floor)
+
+    def decide(self, category: str, prob: float, base: float, strict: bool = False) -> Dict[str, Any]:
+        """
+        Returns {passed, threshold, skip_probability, skipped}.
+        `strict` uses `>` instead of `>=` (the prophet Oracle's comparison).
+        """
+        th = self.threshold(category, base)
+        skip_p = self.skip_probability(category)
+        above = prob > th if strict else prob >= th
+        skipped = above and skip_p > 0 and random.random() < skip_p
+        passed = above and not skipped
+        if not passed and prob >= base:
+            # only count work the static threshold would have paid for
+            self._record_saved()
+        return {"passed": passed, "threshold": th, "skip_probability": skip_p, "skipped": skipped}
+
+    def _record_saved(self) -> None:
+        with self._lock:
+            self._pending["skipped_runs"] += 1
+            llm_calls = llm_calls_per_run()
+            self._pending["llm_calls"] += llm_calls
+            self._pending["images"] += IMAGES_PER_RUN
+            self._pending["dollars"] += llm_calls * self.cost_per_llm_call + IMAGES_PER_RUN * self.cost_per_image
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.flush_s, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def flush(self) -> None:
+        """Adds the batched avoided-work counters to the state file."""
+        with self._lock:
+            self._flush_timer = None
+            if not self._pending["skipped_runs"]:
+                return
+            try:
+                with self._update():
+                    for k, v in self._pending.items():
+                        self._saved[k] = self._saved.get(k, 0) + v
+            except OSError as e:
+                # keep the counts for the next flush
+                print(f"[PREFILTER] could not save avoided-work counters: {e}")
+                return
+            self._pending = dict.fromkeys(self._pending, 0)
+
+    def snapshot(self, base: float = 0.70) -> Dict[str, Any]:
+        with self._lock:
+            self._reload()
+            cats = list(self._cats)
+            saved = {k: v + self._pending[k] for k, v in self._saved.items()}
+        now = time.time()
+        out = {}
+        for cat in cats:
+            r, l = self._decayed(cat, now)
+            out[cat] = {
+                "rejects": round(r, 3),
+                "launches": round(l, 3),
+                "threshold": round(self.threshold(cat, base), 4),
+                "skip_probability": round(self.skip_probability(cat), 4),
+            }
+        return {"categories": out, "saved": saved}
+
+
+_controller: Optional[ThresholdController] = None
+
+
+def get_controller() -> ThresholdController:
+    global _controller
+    if _controller is None:
+        _controller = ThresholdController()
+        atexit.register(_controller.flush)
+    return _controller
@@ -0,0 +1,365 @@
+from __future__ import annotations
+
+import contextvars
+import json
+import os
+import queue
+import secrets
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+SERVICE_NAME = "prophet-agents-backend"
+SCOPE_NAME = "backend.tracing"
+
+# OTLP span kinds / status codes
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT = 1, 2, 3
+STATUS_OK, STATUS_ERROR = 1, 2
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "status", "message")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: str, kind: int, attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.status = STATUS_OK
+        self.message = ""
+
+    def set(self, **attrs: Any) -> None:
+        self.attributes.update(attrs)
+
+    def fail(self, exc: BaseException) -> None:
+        self.status = STATUS_ERROR
+        self.message = f"{type(exc).__name__}: {exc}"[:500]
+
+    def to_otlp(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": [_otlp_attr(k, v) for k, v in self.attributes.items() if v is not None],
+            "status": {"code": self.status, **({"message": self.message} if self.message else {})},
+        }
+        if self.parent_id:
+            out["parentSpanId"] = self.parent_id
+        return out
+
+
+class _NoopSpan:
+    """Handed out when no trace is active, so instrumented code doesn't need to check."""
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+    def fail(self, exc: BaseException) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Trace:
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        self.trace_id = secrets.token_hex(16)
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = [s.to_otlp() for s in self.spans]
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": [_otlp_attr("service.name", SERVICE_NAME), _otlp_attr("run.id", self.run_id)]},
+                    "scopeSpans": [{"scope": {"name": SCOPE_NAME}, "spans": spans}],
+                }
+            ]
+        }
+
+
+def _otlp_attr(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        v: Dict[str, Any] = {"boolValue": value}
+    elif isinstance(value, int):
+        v = {"intValue": str(value)}  # OTLP/JSON encodes int64 as a string
+    elif isinstance(value, float):
+        v = {"doubleValue": value}
+    elif isinstance(value, (list, tuple)):
+        v = {"arrayValue": {"values": [_otlp_attr("", x)["value"] for x in value]}}
+    else:
+        v = {"stringValue": str(value)}
+    return {"key": key, "value": v}
+
+
+def _attr_value(v: Dict[str, Any]) -> Any:
+    if "intValue" in v:
+        return int(v["intValue"])
+    if "arrayValue" in v:
+        return [_attr_value(x) for x in v["arrayValue"].get("values", [])]
+    return next(iter(v.values()), None)
+
+
+# ---- context
+
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("trace_span", default=None)
+
+
+@contextmanager
+def start_trace(run_id: str, name: str = "run", **attrs: Any) -> Iterator[Span]:
+    """Opens the root span of a run; the finished trace is handed to the trace store's writer."""
+    trace = Trace(run_id)
+    root = Span(trace, name, "", KIND_SERVER, {"run.id": run_id, **attrs})
+    trace.add(root)
+    token = _current.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.fail(e)
+        raise
+    finally:
+        root.end_ns = time.time_ns()
+        _current.reset(token)
+        get_trace_store().submit(trace)
+
+
+@contextmanager
+def span(name: str, kind: int = KIND_INTERNAL, **attrs: Any) -> Iterator[Any]:
+    """Child span of the current one; a no-op outside a trace."""
+    parent = _current.get()
+    if parent is None:
+        yield _NOOP
+        return
+    s = Span(parent.trace, name, parent.span_id, kind, attrs)
+    parent.trace.add(s)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.fail(e)
+        raise
+    finally:
+        s.end_ns = time.time_ns()
+        _current.reset(token)
+
+
+def current() -> Any:
+    """The active span (or a no-op one), for adding attributes from deeper in the call."""
+    return _current.get() or _NOOP
+
+
+def add_span(
+    name: str,
+    start_ns: int,
+    end_ns: int,
+    kind: int = KIND_INTERNAL,
+    error: Optional[BaseException] = None,
+    **attrs: Any,
+) -> None:
+    """
+    Records an already finished interval under the current span without making it current,
+    e.g. time spent waiting in a queue, or a generator whose body runs between the caller's steps.
+    """
+    parent = _current.get()
+    if parent is None:
+        return
+    s = Span(parent.trace, name, parent.span_id, kind, attrs)
+    s.start_ns, s.end_ns = start_ns, end_ns
+    if error is not None:
+        s.fail(error)
+    parent.trace.add(s)
+
+
+def traced(name: str, fn: Callable[..., T], **attrs: Any) -> Callable[..., T]:
+    def wrapper(*args: Any, **kwargs: Any) -> T:
+        with span(name, **attrs):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def bind(fn: Callable[..., T]) -> Callable[..., T]:
+    """Carries the current span into a pool thread: pool.submit(bind(fn), ...)."""
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)
+
+
+# ---- store
+
+class TraceStore:
+    """
+    Finished traces, one OTLP/JSON document per run, in SQLite (TRACE_DB_PATH).
+    Only the newest TRACE_KEEP_RUNS runs are kept; older ones are pruned every
+    TRACE_PRUNE_EVERY saves.
+
+    `submit` hands a trace to a writer thread, so finishing a run (often on the event
+    loop) never waits on SQLite. Reads flush pending writes first.
+    """
+
+    def __init__(self, path: Optional[str | Path] = None, keep: Optional[int] = None):
+        self.path = str(path or os.getenv("TRACE_DB_PATH", Path(__file__).with_name("traces.sqlite3")))
+        self.keep = int(keep if keep is not None else os.getenv("TRACE_KEEP_RUNS", "1000"))
+        self.prune_every = max(1, int(os.getenv("TRACE_PRUNE_EVERY", "0")) or self.keep // 10)
+        self._lock = threading.Lock()
+        self._saves = 0
+        self._queue: "queue.Queue[Trace]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_pid = 0
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS traces (
+                run_id TEXT PRIMARY KEY,
+                trace_id TEXT NOT NULL,
+                name TEXT NOT NULL,
+                started_at REAL NOT NULL,
+                duration_ms REAL NOT NULL,
+                spans INTEGER NOT NULL,
+                error INTEGER NOT NULL,
+                otlp TEXT NOT NULL
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS traces_started ON traces (started_at)")
+        self._db.commit()
+
+    # ---- writes
+
+    def submit(self, trace: Trace) -> None:
+        """Queues a finished trace for the writer thread."""
+        with self._lock:
+            # a forked worker inherits the store but not the thread
+            if self._writer is None or self._writer_pid != os.getpid():
+                self._writer_pid = os.getpid()
+                self._writer = threading.Thread(target=self._write_loop, daemon=True, name="trace-writer")
+                self._writer.start()
+        self._queue.put(trace)
+
+    def _write_loop(self) -> None:
+        while True:
+            trace = self._queue.get()
+            try:
+                self.save(trace)
+            except Exception as e:  # tracing must never fail a run
+                print(f"[TRACE] could not save trace for run {trace.run_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self) -> None:
+        """Waits until every submitted trace is written."""
+        self._queue.join()
+
+    def save(self, trace: Trace) -> None:
+        root = trace.spans[0]
+        doc = trace.to_otlp()
+        error = any(s.status == STATUS_ERROR for s in trace.spans)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO traces VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    trace.run_id,
+                    trace.trace_id,
+                    root.name,
+                    root.start_ns / 1e9,
+                    (root.end_ns - root.start_ns) / 1e6,
+                    len(trace.spans),
+                    int(error),
+                    json.dumps(doc, separators=(",", ":")),
+                ),
+            )
+            self._saves += 1
+            if self.keep > 0 and self._saves % self.prune_every == 0:
+                self._prune()
+            self._db.commit()
+
+    def _prune(self) -> None:
+        # start of the keep-th newest run, found by walking the started_at index backwards
+        row = self._db.execute(
+            "SELECT started_at FROM traces ORDER BY started_at DESC LIMIT 1 OFFSET ?", (self.keep - 1,)
+        ).fetchone()
+        if row is not None:
+            self._db.execute("DELETE FROM traces WHERE started_at < ?", (row[0],))
+
+    # ---- reads
+
+    def otlp(self, run_id: str) -> Optional[Dict[str, Any]]:
+        self.flush()
+        with self._lock:
+            row = self._db.execute("SELECT otlp FROM traces WHERE run_id = ?", (run_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def recent(self, limit: int = 50) -> List[Dict[str, Any]]:
+        self.flush()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT run_id, trace_id, name, started_at, duration_ms, spans, error FROM traces ORDER BY started_at DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [
+            {"run_id": r, "trace_id": t, "name": n, "started_at": s, "duration_ms": round(d, 3), "spans": c, "error": bool(e)}
+            for r, t, n, s, d, c, e in rows
+        ]
+
+
+def waterfall(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Flattens an OTLP document into rows ordered by start, with offsets relative to the root."""
+    spans = [s for rs in doc.get("resourceSpans", []) for ss in rs.get("scopeSpans", []) for s in ss.get("spans", [])]
+    if not spans:
+        return {"spans": []}
+    t0 = min(int(s["startTimeUnixNano"]) for s in spans)
+    t1 = max(int(s["endTimeUnixNano"]) for s in spans)
+    parents = {s["spanId"]: s.get("parentSpanId", "") for s in spans}
+
+    def depth(span_id: str) -> int:
+        d = 0
+        while parents.get(span_id):
+            span_id = parents[span_id]
+            d += 1
+        return d
+
+    rows = []
+    for s in sorted(spans, key=lambda s: (int(s["startTimeUnixNano"]), depth(s["spanId"]))):
+        start, end = int(s["startTimeUnixNano"]), int(s["endTimeUnixNano"])
+        rows.append(
+            {
+                "span_id": s["spanId"],
+                "parent_id": s.get("parentSpanId"),
+                "name": s["name"],
+                "depth": depth(s["spanId"]),
+                "start_ms": round((start - t0) / 1e6, 3),
+                "duration_ms": round((end - start) / 1e6, 3),
+                "status": "error" if s.get("status", {}).get("code") == STATUS_ERROR else "ok",
+                "error": s.get("status", {}).get("message"),
+                "attributes": {a["key"]: _attr_value(a["value"]) for a in s.get("attributes", [])},
+            }
+        )
+    return {"trace_id": spans[0]["traceId"], "duration_ms": round((t1 - t0) / 1e6, 3), "spans": rows}
+
+
+_store: Optional[TraceStore] = None
+
+
+def get_trace_store() -> TraceStore:
+    global _store
+    if _store is None:
+        _store = TraceStore()
+    return _store
@@ -0,0 +1,339 @@
+"""
+Sharded multi-process workers for large market sweeps.
+
+Jobs live in a SQLite queue (WORKER_QUEUE_PATH) that any number of worker processes
+share. Jobs are claimed highest momentum score first (backend.momentum: probability,
+velocity, acceleration, level crossings at enqueue time), and run as sweeps, so a market
+whose trajectory hasn't changed since its last run stops at the prefilter. Each market
+id hashes to one of --num-shards shards; a worker prefers the shards it owns and steals
+from other shards when its own are empty, so a dead worker's shard still drains. Claimed
+jobs hold a lease that a heartbeat thread keeps extending; a worker that crashes stops
+heart-beating, its leases expire and the jobs are claimed again (up to --max-attempts).
+Workers only exit once nothing is queued or leased, so surviving workers wait out the
+lease of a crashed one instead of leaving its job behind.
+
+    python -m backend.worker enqueue --mock              # the 6 mock markets
+    python -m backend.worker enqueue --synthetic 5000
+    python -m backend.worker run --procs 8               # 8 local worker processes
+    python -m backend.worker run --procs 4 --worker-index 1 --workers 2   # machine 2 of 2
+    python -m backend.worker status
+
+Several machines can share one queue file only on a filesystem with working POSIX locks;
+otherwise run one queue per machine.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+DEFAULT_QUEUE_PATH = Path(__file__).with_name("worker_queue.sqlite3")
+
+
+def shard_of(market_id: str, num_shards: int) -> int:
+    return zlib.crc32(market_id.encode("utf-8")) % num_shards
+
+
+class JobQueue:
+    def __init__(self, path: Optional[str | Path] = None, lease_s: float = 120.0):
+        self.path = str(path or os.getenv("WORKER_QUEUE_PATH", DEFAULT_QUEUE_PATH))
+        self.lease_s = lease_s
+        # autocommit; writes that must be atomic use explicit BEGIN IMMEDIATE
+        self._db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                market_id TEXT PRIMARY KEY,
+                shard INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                priority REAL NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'queued',  -- queued | leased | done | failed
+                owner TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, shard, priority);
+            CREATE TABLE IF NOT EXISTS workers (
+                worker_id TEXT PRIMARY KEY,
+                host TEXT NOT NULL,
+                pid INTEGER NOT NULL,
+                shards TEXT NOT NULL,
+                started_at REAL NOT NULL,
+                heartbeat_at REAL NOT NULL,
+                done INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0
+            );
+            """
+        )
+
+    def enqueue(self, markets: List[Dict[str, Any]], num_shards: int, threshold: float = 0.70) -> int:
+        from backend.momentum import get_tracker
+
+        tracker = get_tracker()
+        now = time.time()
+        rows = []
+        for m in markets:
+            # dry run: the worker's prefilter records the snapshot when it runs the job
+            score = tracker.observe(m["market_id"], m["market_values"], record=False)["score"]
+            payload = json.dumps({"market": m, "threshold": threshold})
+            rows.append((m["market_id"], shard_of(m["market_id"], num_shards), payload, score, now))
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            # re-enqueueing a market resets it, whatever state it was in
+            self._db.executemany(
+                """
+                INSERT INTO jobs (market_id, shard, payload, priority, updated_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(market_id) DO UPDATE SET
+                    shard = excluded.shard, payload = excluded.payload, priority = excluded.priority, status = 'queued',
+                    owner = NULL, lease_expires = NULL, attempts = 0, result = NULL, error = NULL,
+                    updated_at = excluded.updated_at
+                """,
+                rows,
+            )
+            self._db.execute("COMMIT")
+        return len(rows)
+
+    def claim(self, worker_id: str, shards: Optional[Set[int]], max_attempts: int) -> Optional[Dict[str, Any]]:
+        """Leases the highest-priority job: own shards first, then any shard, including expired leases."""
+        now = time.time()
+        claimable = "(status = 'queued' OR (status = 'leased' AND lease_expires < ?))"
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                # expired leases that have used up their attempts are failed, not retried forever
+                self._db.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'lease expired too many times', updated_at = ? "
+                    "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                    (now, now, max_attempts),
+                )
+                row = None
+                if shards:
+                    marks = ",".join("?" * len(shards))
+                    row = self._db.execute(
+                        f"SELECT market_id, payload, attempts FROM jobs WHERE {claimable} AND shard IN ({marks}) ORDER BY priority DESC LIMIT 1",
+                        (now, *shards),
+                    ).fetchone()
+                if row is None:
+                    row = self._db.execute(
+                        f"SELECT market_id, payload, attempts FROM jobs WHERE {claimable} ORDER BY priority DESC LIMIT 1", (now,)
+                    ).fetchone()
+                if row is None:
+                    self._db.execute("COMMIT")
+                    return None
+                market_id, payload, attempts = row
+                self._db.execute(
+                    "UPDATE jobs SET status = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1, updated_at = ? "
+                    "WHERE market_id = ?",
+                    (worker_id, now + self.lease_s, now, market_id),
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return {"market_id": market_id, "attempt": attempts + 1, **json.loads(payload)}
+
+    def complete(self, worker_id: str, market_id: str, result: Any = None, error: Optional[str] = None, retry: bool = False) -> None:
+        status = "queued" if retry else ("failed" if error else "done")
+        with self._lock:
+            # only the current lease holder may settle a job; a re-leased job belongs to someone else
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, owner = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE market_id = ? AND owner = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), market_id, worker_id),
+            )
+            col = "failed" if error else "done"
+            self._db.execute(f"UPDATE workers SET {col} = {col} + 1 WHERE worker_id = ?", (worker_id,))
+
+    def register(self, worker_id: str, shards: Optional[Set[int]]) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO workers (worker_id, host, pid, shards, started_at, heartbeat_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (worker_id, socket.gethostname(), os.getpid(), json.dumps(sorted(shards) if shards else "any"), now, now),
+            )
+
+    def heartbeat(self, worker_id: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute("UPDATE workers SET heartbeat_at = ? WHERE worker_id = ?", (now, worker_id))
+            self._db.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE owner = ? AND status = 'leased'", (now + self.lease_s, worker_id)
+            )
+
+    def outstanding(self) -> int:
+        """Jobs that are queued or leased, i.e. that some worker may still have to run."""
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'leased')").fetchone()[0]
+
+    def status(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            counts = dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            workers = [
+                {
+                    "worker_id": w,
+                    "host": h,
+                    "pid": p,
+                    "shards": json.loads(s),
+                    "done": d,
+                    "failed": f,
+                    "heartbeat_age_s": round(now - hb, 1),
+                    "jobs_per_s": round(d / max(1e-9, hb - st), 2),
+                }
+                for w, h, p, s, st, hb, d, f in self._db.execute(
+                    "SELECT worker_id, host, pid, shards, started_at, heartbeat_at, done, failed FROM workers ORDER BY worker_id"
+                )
+            ]
+        return {"jobs": counts, "workers": workers}
+
+
+def _jsonable(out: Dict[str, Any]) -> Dict[str, Any]:
+    return json.loads(json.dumps(out, default=lambda o: o.model_dump() if hasattr(o, "model_dump") else str(o)))
+
+
+def run_worker(
+    worker_id: str,
+    shards: Optional[Set[int]],
+    queue_path: Optional[str] = None,
+    lease_s: float = 120.0,
+    max_attempts: int = 3,
+    idle_exit_s: float = 5.0,
+) -> None:
+    """
+    One worker process: build the graph once, then claim and run jobs until nothing has been
+    queued or leased for `idle_exit_s`. A job leased by a crashed worker keeps everyone polling
+    until its lease expires and it can be claimed again.
+    """
+    from backend.graph import build_graph
+    from backend.models import GraphState, Market
+    from backend.tracing import get_trace_store, start_trace
+
+    q = JobQueue(queue_path, lease_s=lease_s)
+    q.register(worker_id, shards)
+    graph = build_graph()
+
+    stop = threading.Event()
+
+    def beat() -> None:
+        while not stop.wait(lease_s / 3):
+            q.heartbeat(worker_id)
+
+    threading.Thread(target=beat, daemon=True, name="heartbeat").start()
+
+    idle_since = None
+    try:
+        while True:
+            job = q.claim(worker_id, shards, max_attempts)
+            if job is None:
+                if q.outstanding():
+                    # someone else's lease (possibly a dead worker's) may still expire into our hands
+                    idle_since = None
+                else:
+                    idle_since = idle_since or time.monotonic()
+                    if time.monotonic() - idle_since > idle_exit_s:
+                        return
+                time.sleep(0.2)
+                continue
+            idle_since = None
+            run_id = uuid.uuid4().hex
+            try:
+                state = GraphState(market=Market(**job["market"]), threshold=job.get("threshold", 0.70), sweep=True)
+                attrs = {"market.id": job["market_id"], "worker.id": worker_id, "attempt": job["attempt"]}
+                with start_trace(run_id, "sweep", **attrs):
+                    out = graph.invoke(state)
+                q.complete(worker_id, job["market_id"], result={"run_id": run_id, **_jsonable(out)})
+            except Exception as e:
+                retry = job["attempt"] < max_attempts
+                print(f"[WORKER] {worker_id} market={job['market_id']} attempt={job['attempt']} error={type(e).__name__}: {e}")
+                q.complete(worker_id, job["market_id"], error=f"{type(e).__name__}: {e}", retry=retry)
+            q.heartbeat(worker_id)
+    finally:
+        stop.set()
+        # worker processes end with os._exit, which would drop traces still queued
+        get_trace_store().flush()
+
+
+def _shards_for(index: int, total_procs: int, num_shards: int) -> Set[int]:
+    return {s for s in range(num_shards) if s % total_procs == index}
+
+
+def main(argv: List[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--queue", help="queue file (default WORKER_QUEUE_PATH or backend/worker_queue.sqlite3)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    enq = sub.add_parser("enqueue")
+    enq.add_argument("--mock", action="store_true")
+    enq.add_argument("--synthetic", type=int, default=0)
+    enq.add_argument("--num-shards", type=int, default=64)
+    enq.add_argument("--threshold", type=float, default=0.70)
+
+    run = sub.add_parser("run")
+    run.add_argument("--procs", type=int, default=os.cpu_count() or 1)
+    run.add_argument("--num-shards", type=int, default=64)
+    run.add_argument("--worker-index", type=int, default=0, help="this machine's index when several share a queue")
+    run.add_argument("--workers", type=int, default=1, help="number of machines sharing the queue")
+    run.add_argument("--lease-s", type=float, default=120.0)
+    run.add_argument("--max-attempts", type=int, default=3)
+    run.add_argument("--idle-exit-s", type=float, default=5.0)
+
+    sub.add_parser("status")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "enqueue":
+        from backend.polymarket import get_mock_markets
+
+        markets: List[Dict[str, Any]] = list(get_mock_markets()) if args.mock else []
+        if args.synthetic:
+            from backend.bench.graph_bench import synthetic_markets
+
+            markets += synthetic_markets(args.synthetic)
+        n = JobQueue(args.queue).enqueue(markets, args.num_shards, args.threshold)
+        print(json.dumps({"enqueued": n}))
+        return 0
+
+    if args.cmd == "status":
+        print(json.dumps(JobQueue(args.queue).status(), indent=2))
+        return 0
+
+    # run: procs on this machine; shards are split across all procs on all machines
+    total = args.procs * args.workers
+    host = socket.gethostname()
+    t0 = time.perf_counter()
+    procs = []
+    for i in range(args.procs):
+        index = args.worker_index * args.procs + i
+        shards = _shards_for(index, total, args.num_shards)
+        p = multiprocessing.Process(
+            target=run_worker,
+            args=(f"{host}-{os.getpid()}-{i}", shards, args.queue, args.lease_s, args.max_attempts, args.idle_exit_s),
+            name=f"worker-{i}",
+        )
+        p.start()
+        procs.append(p)
+    for p in procs:
+        p.join()
+
+    status = JobQueue(args.queue).status()
+    status["wall_s"] = round(time.perf_counter() - t0, 2)
+    print(json.dumps(status, indent=2))
+    return 0 if all(p.exitcode == 0 for p in procs) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
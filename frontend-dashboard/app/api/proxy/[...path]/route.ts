@@ -2,14 +2,38 @@ import { NextRequest, NextResponse } from "next/server";
 
 const BACKEND_URL = process.env.BACKEND_URL ?? "http://127.0.0.1:8000";
 
+// "stream" (default): pipe the backend body through and keep its caching headers, so
+// /generated assets stay cacheable and conditional/range requests reach the backend.
+// "buffer": the old behaviour, read the whole body and mark every response no-store.
+const PROXY_MODE = process.env.PROXY_MODE ?? "stream";
+
+// hop-by-hop headers describe one connection and must not be forwarded
+const HOP_BY_HOP = [
+  "connection",
+  "keep-alive",
+  "proxy-authenticate",
+  "proxy-authorization",
+  "te",
+  "trailer",
+  "transfer-encoding",
+  "upgrade",
+];
+
+// statuses that never carry a body
+const NO_BODY = new Set([204, 304]);
+
 async function forward(req: NextRequest, path: string | string[] | undefined) {
   const parts = Array.isArray(path) ? path : path ? [path] : [];
   const url = new URL(req.url);
 
   const target = `${BACKEND_URL}/${parts.join("/")}${url.search}`;
 
+  // If-None-Match, If-Range and Range pass through, so the backend can answer 304 / 206
   const headers = new Headers(req.headers);
   headers.delete("host");
+  // fetch would decode a compressed body, leaving the ETag and Range offsets pointing at
+  // bytes the browser never sees; ask for the plain file (fetch adds gzip/br if unset)
+  headers.set("accept-encoding", "identity");
 
   const body =
     req.method === "GET" || req.method === "HEAD" ? undefined : await req.arrayBuffer();
@@ -18,16 +42,40 @@ async function forward(req: NextRequest, path: string | string[] | undefined) {
     method: req.method,
     headers,
     body: body ? Buffer.from(body) : undefined,
+    // caching is the browser's job, driven by the backend's headers
+    cache: "no-store",
   });
 
-  // IMPORTANT: do not .text() for images
-  const buf = await res.arrayBuffer();
+  if (PROXY_MODE === "buffer") {
+    // IMPORTANT: do not .text() for images
+    const buf = await res.arrayBuffer();
+
+    const outHeaders = new Headers(res.headers);
+    // Allow browser to render images
+    outHeaders.set("cache-control", "no-store");
+
+    return new NextResponse(buf, {
+      status: res.status,
+      headers: outHeaders,
+    });
+  }
 
   const outHeaders = new Headers(res.headers);
-  // Allow browser to render images
-  outHeaders.set("cache-control", "no-store");
+  for (const h of HOP_BY_HOP) outHeaders.delete(h);
+  if (outHeaders.has("content-encoding")) {
+    // encoded anyway: fetch has decoded the body, so its encoding and length no longer
+    // apply and the ETag can only vouch for equivalent, not identical, bytes
+    outHeaders.delete("content-encoding");
+    outHeaders.delete("content-length");
+    const etag = outHeaders.get("etag");
+    if (etag && !etag.startsWith("W/")) outHeaders.set("etag", `W/${etag}`);
+  }
+  if (!outHeaders.has("cache-control")) {
+    // API responses without their own policy stay uncached, as before
+    outHeaders.set("cache-control", "no-store");
+  }
 
-  return new NextResponse(buf, {
+  return new NextResponse(NO_BODY.has(res.status) || req.method === "HEAD" ? null : res.body, {
     status: res.status,
     headers: outHeaders,
   });
@@ -38,6 +86,11 @@ export async function GET(req: NextRequest, ctx: any) {
     return forward(req, params.path);
 }
 
+export async function HEAD(req: NextRequest, ctx: any) {
+    const params = await ctx.params;
+    return forward(req, params.path);
+}
+
 export async function POST(req: NextRequest, ctx: any) {
     const params = await ctx.params;
     return forward(req, params.path);
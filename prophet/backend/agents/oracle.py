@@ -2,11 +2,15 @@ import httpx
 import random
 from typing_extensions import List, Dict, Any
 from .state import TrendOpportunity
+from ..store import opportunity_id
+from backend.thresholds import get_controller
+from backend.momentum import get_tracker
 
 class OracleAgent:
     def __init__(self):
         self.api_url = "https://gamma-api.polymarket.com/events"
         self.categories = ["Culture", "Sports", "Tech", "Politics", "Science"]
+        self.base_threshold = 0.70
 
     async def fetch_opportunities(self) -> List[TrendOpportunity]:
         # specific implementation to fetch from Polymarket
@@ -27,10 +31,21 @@ class OracleAgent:
             {"event": "New iPhone Release Date", "probability": 0.90, "category": "Tech"}
         ]
 
-        opportunities = []
+        controller = get_controller()
+        tracker = get_tracker()
+        found: List[TrendOpportunity] = []
         for ev in mock_events:
-            if ev["probability"] > 0.70: # High Confidence filter
+            opp_id = opportunity_id(ev["event"], ev["category"])
+            # Velocity: every scan is a snapshot in the event's probability history
+            sig = tracker.observe(opp_id, {"Yes": ev["probability"]})
+            retrigger, why = tracker.should_trigger(sig)
+            # High Confidence filter, tightened per category by user feedback
+            d = controller.decide(ev["category"], ev["probability"], base=self.base_threshold, strict=True)
+            if d["passed"]:
+                if retrigger:
+                    tracker.mark_triggered(sig)
                 opp: TrendOpportunity = {
+                    "id": opp_id,
                     "event": ev["event"],
                     "probability": ev["probability"],
                     "category": ev["category"],
@@ -41,12 +56,17 @@ class OracleAgent:
                     "seo_description": None,
                     "email_subject": None,
                     "ad_copy": None,
-                    "logs": [f"Oracle detected '{ev['event']}' ({int(ev['probability']*100)}%)"],
-                    "status": "detected"
+                    "logs": [
+                        f"Oracle detected '{ev['event']}' ({int(ev['probability']*100)}%, "
+                        f"{sig['velocity']*100:+.1f} pts/h)"
+                    ],
+                    "status": "detected",
+                    "momentum": {**sig, "retrigger": retrigger, "reason": why},
                 }
-                opportunities.append(opp)
-        
-        return opportunities
+                found.append(opp)
+
+        # fastest-moving first, so the agent chain spends its budget where the hype is building
+        return sorted(found, key=lambda o: o["momentum"]["score"], reverse=True)
 
     def run(self, state: TrendOpportunity) -> TrendOpportunity:
         # This method matches the node signature for LangGraph if used as a node
@@ -1,6 +1,7 @@
-from typing_extensions import TypedDict, Optional, List, Dict, Any
+from typing_extensions import TypedDict, Optional, List, Dict, Any, NotRequired
 
 class TrendOpportunity(TypedDict):
+    id: NotRequired[str] # stable, see store.opportunity_id
     event: str
     probability: float
     category: str
@@ -15,4 +16,5 @@ class TrendOpportunity(TypedDict):
     ad_copy: Optional[str]
     # Metadata
     logs: List[str]
-    status: str # 'detected', 'merchandised', 'marketed', 'ready'
+    status: str # 'detected', 'merchandised', 'marketed', 'ready', 'launched'
+    momentum: NotRequired[Dict[str, Any]] # backend.momentum signal + whether this scan re-triggered it
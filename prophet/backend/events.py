@@ -0,0 +1,252 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import sqlite3
+import time
+from collections import Counter, deque
+from typing_extensions import Any, Callable, Deque, Dict, List, Optional, Tuple
+from .store import DEFAULT_DB_PATH
+
+logger = logging.getLogger(__name__)
+
+# Amplitude-style event names the dashboard sends
+REJECTED = "opportunity_rejected"
+ACCEPTED = "opportunity_accepted"
+LAUNCHED = "opportunity_launched"
+VIEWED = "opportunity_viewed"
+
+# Amplitude sends epoch milliseconds; anything above this is read as ms (1e11 s is year 5138)
+_MS_THRESHOLD = 1e11
+
+
+class _Rolling:
+    """Per-category counters: lifetime totals plus a sliding window kept as a running sum."""
+
+    def __init__(self, window_buckets: int, bucket_seconds: float):
+        self.total: Counter = Counter()
+        self.window: Counter = Counter()
+        self._buckets: Deque[Tuple[int, Counter]] = deque()
+        self._window_buckets = window_buckets
+        self._bucket_seconds = bucket_seconds
+
+    def _evict(self, now_bucket: int) -> None:
+        while self._buckets and self._buckets[0][0] <= now_bucket - self._window_buckets:
+            _, old = self._buckets.popleft()
+            self.window.subtract(old)
+
+    def add(self, event_type: str, ts: float) -> None:
+        b = int(ts // self._bucket_seconds)
+        self._evict(b)
+        if not self._buckets or self._buckets[-1][0] < b:
+            self._buckets.append((b, Counter()))
+        # late events land in the newest bucket; good enough for a rolling view
+        self._buckets[-1][1][event_type] += 1
+        self.window[event_type] += 1
+        self.total[event_type] += 1
+
+    def snapshot(self, now: float) -> Dict[str, Any]:
+        self._evict(int(now // self._bucket_seconds))
+        return {"total": _with_rates(self.total), "window": _with_rates(self.window)}
+
+
+def _with_rates(c: Counter) -> Dict[str, Any]:
+    views = c[VIEWED]
+    decided = c[ACCEPTED] + c[REJECTED]
+    return {
+        "counts": {k: v for k, v in c.items() if v},
+        "rejections": c[REJECTED],
+        "launches": c[LAUNCHED],
+        "ctr": (c[ACCEPTED] / views) if views else None,
+        "rejection_rate": (c[REJECTED] / decided) if decided else None,
+    }
+
+
+class EventIngestor:
+    """
+    Buffered event ingestion.
+
+    `ingest` only appends to a bounded ring buffer and bumps in-memory counters, so the
+    request handler never waits on disk. A background task drains the buffer in bulk
+    into an append-only SQLite table (`executemany` in a worker thread). If producers
+    outrun the flusher the oldest unflushed events are dropped and counted in `dropped`;
+    aggregates still include them.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        capacity: int = 100_000,
+        flush_interval: float = 1.0,
+        flush_batch: int = 5_000,
+        window_seconds: float = 3600.0,
+        bucket_seconds: float = 60.0,
+        on_flush: Optional[Callable[[List[Tuple[float, str, str, str]]], None]] = None,
+    ):
+        self.db_path = str(db_path or os.getenv("PROPHET_DB_PATH", DEFAULT_DB_PATH))
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        # called from the flush thread with each written batch of (ts, event_type, category, properties)
+        self.on_flush = on_flush
+        self._buffer: Deque[Tuple[float, str, str, str]] = deque(maxlen=capacity)
+        self._window_buckets = max(1, int(window_seconds // bucket_seconds))
+        self._bucket_seconds = bucket_seconds
+        self._by_category: Dict[str, _Rolling] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+
+        self.ingested = 0
+        self.flushed = 0
+        self.dropped = 0
+
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS events (
+                ts REAL NOT NULL,
+                event_type TEXT NOT NULL,
+                category TEXT NOT NULL,
+                properties TEXT NOT NULL
+            )
+            """
+        )
+        self._db.commit()
+        self._load_totals()
+
+    def _rolling(self, category: str) -> _Rolling:
+        r = self._by_category.get(category)
+        if r is None:
+            r = self._by_category[category] = _Rolling(self._window_buckets, self._bucket_seconds)
+        return r
+
+    def _load_totals(self) -> None:
+        # lifetime totals survive restarts; the rolling window starts empty
+        rows = self._db.execute("SELECT category, event_type, COUNT(*) FROM events GROUP BY category, event_type")
+        for category, event_type, n in rows:
+            self._rolling(category).total[event_type] += n
+
+    # ---- write path
+
+    @staticmethod
+    def _parse(i: int, ev: Any, now: float) -> Tuple[float, str, str, str]:
+        if not isinstance(ev, dict):
+            raise ValueError(f"event {i}: expected an object")
+        props = ev.get("properties") or {}
+        if not isinstance(props, dict):
+            raise ValueError(f"event {i}: properties must be an object")
+        raw_ts = ev.get("time")
+        if raw_ts is None:
+            ts = now
+        else:
+            try:
+                ts = float(raw_ts)
+            except (TypeError, ValueError):
+                raise ValueError(f"event {i}: time must be a number") from None
+            if isinstance(raw_ts, bool) or not math.isfinite(ts) or ts < 0:
+                raise ValueError(f"event {i}: time must be a number")
+            if ts > _MS_THRESHOLD:
+                ts /= 1000.0
+            # clock skew must not push events into buckets that haven't started yet
+            ts = min(ts, now)
+        event_type = str(ev.get("event_type") or "unknown")
+        category = str(props.get("category") or "unknown")
+        return ts, event_type, category, json.dumps(props, separators=(",", ":"))
+
+    def ingest(self, events: List[Dict[str, Any]]) -> int:
+        """
+        Buffers a batch of Amplitude-style events. `time` may be epoch seconds or
+        milliseconds; future times are clamped to now. The whole batch is validated first,
+        so a ValueError means none of it was taken.
+        """
+        now = time.time()
+        rows = [self._parse(i, ev, now) for i, ev in enumerate(events)]
+        for row in rows:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+            self._buffer.append(row)
+            self._rolling(row[2]).add(row[1], row[0])
+
+        self.ingested += len(events)
+        if self._wake is not None and len(self._buffer) >= self.flush_batch:
+            self._wake.set()
+        return len(events)
+
+    def _write(self, rows: List[Tuple[float, str, str, str]]) -> None:
+        self._db.executemany("INSERT INTO events (ts, event_type, category, properties) VALUES (?, ?, ?, ?)", rows)
+        self._db.commit()
+        if self.on_flush is not None:
+            self.on_flush(rows)
+
+    async def flush(self) -> int:
+        """
+        Writes the buffer out in batches. If a write fails its batch goes back to the front
+        of the buffer (the newest events give way if that overflows it) and the error is raised.
+        """
+        written = 0
+        try:
+            while self._buffer:
+                n = min(len(self._buffer), self.flush_batch)
+                rows = [self._buffer.popleft() for _ in range(n)]
+                try:
+                    await asyncio.to_thread(self._write, rows)
+                except BaseException:
+                    overflow = len(self._buffer) + len(rows) - (self._buffer.maxlen or 0)
+                    if self._buffer.maxlen is not None and overflow > 0:
+                        self.dropped += overflow
+                    self._buffer.extendleft(reversed(rows))
+                    raise
+                written += n
+        finally:
+            self.flushed += written
+        return written
+
+    async def _run(self) -> None:
+        assert self._wake is not None
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception:
+                # the batch is back in the buffer; retry on the next tick
+                logger.exception("event flush failed; %d events buffered", len(self._buffer))
+
+    def start(self) -> None:
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    # ---- read path
+
+    def aggregate(self, category: str) -> Dict[str, Any]:
+        r = self._by_category.get(category)
+        if r is None:
+            return {"total": _with_rates(Counter()), "window": _with_rates(Counter())}
+        return r.snapshot(time.time())
+
+    def aggregates(self) -> Dict[str, Dict[str, Any]]:
+        now = time.time()
+        return {c: r.snapshot(now) for c, r in self._by_category.items()}
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "ingested": self.ingested,
+            "flushed": self.flushed,
+            "buffered": len(self._buffer),
+            "dropped": self.dropped,
+        }
@@ -1,12 +1,46 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from typing_extensions import List, Dict
+from typing_extensions import List, Dict, Optional, Union
+from contextlib import asynccontextmanager
 import asyncio
+import logging
 from .agents.oracle import OracleAgent
 from .graph import app_graph
 from .agents.state import TrendOpportunity
+from .store import OpportunityStore
+from .events import EventIngestor, LAUNCHED, REJECTED
+from backend.thresholds import get_controller
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+def _feed_thresholds(rows):
+    """
+    AI loop: fold flushed reject/launch events into the per-category prefilter thresholds.
+    Runs in the flush thread, once per batch, so the request path never waits on it.
+    """
+    rejects: Dict[str, int] = {}
+    launches: Dict[str, int] = {}
+    for _, event_type, category, _ in rows:
+        if event_type == REJECTED:
+            rejects[category] = rejects.get(category, 0) + 1
+        elif event_type == LAUNCHED:
+            launches[category] = launches.get(category, 0) + 1
+    controller = get_controller()
+    for category, n in rejects.items():
+        controller.record_rejection(category, n)
+    for category, n in launches.items():
+        controller.record_launch(category, n)
+
+events = EventIngestor(on_flush=_feed_thresholds)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    events.start()
+    yield
+    # drain whatever is still buffered before the process exits
+    await events.stop()
+
+app = FastAPI(lifespan=lifespan)
 
 # Allow CORS for development
 app.add_middleware(
@@ -19,16 +53,14 @@ app.add_middleware(
 
 oracle = OracleAgent()
 
-# In-memory store for demo purposes
-generated_opportunities: List[TrendOpportunity] = []
+# Indexed in memory, persisted to SQLite (PROPHET_DB_PATH) so restarts keep state
+store = OpportunityStore()
 
 @app.get("/api/scan")
 async def scan_market():
     """
     Triggers the Oracle to scan Polymarket and runs the agent chain for found opportunities.
     """
-    global generated_opportunities
-    
     # 1. Oracle finds opportunities
     raw_opportunities = await oracle.fetch_opportunities()
     
@@ -36,17 +68,60 @@ async def scan_market():
     
     # 2. Run each opportunity through the Merchandiser -> Marketer graph
     for opp in raw_opportunities:
+        stored = store.get(opp["id"])
+        if stored and (stored["status"] == "launched" or not opp["momentum"]["retrigger"]):
+            # trajectory hasn't moved since the last run, or the product is already live:
+            # keep its products and status, refresh the numbers
+            processed_opps.append({**stored, "probability": opp["probability"], "momentum": opp["momentum"]})
+            continue
         # Run the graph
         # LangGraph invoke returns the final state
         final_state = await app_graph.ainvoke(opp)
         processed_opps.append(final_state)
     
-    generated_opportunities = processed_opps
+    # Upsert by stable id: re-detected opportunities refresh in place, stale ones age out via TTL
+    # the SQLite commit runs off the event loop, like the event flusher's writes
+    await asyncio.to_thread(store.upsert_many, processed_opps)
     return processed_opps
 
 @app.get("/api/opportunities")
-async def get_opportunities():
-    return generated_opportunities
+async def get_opportunities(
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    category: Optional[str] = None,
+    status: Optional[str] = None,
+    min_prob: Optional[float] = None,
+):
+    """
+    One page of opportunities, highest probability first.
+    Pass `next_cursor` back as `cursor` for the next page.
+    """
+    try:
+        return store.page(limit=max(1, min(limit, 500)), cursor=cursor, category=category, status=status, min_prob=min_prob)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+@app.get("/api/opportunities/changes")
+async def get_opportunity_changes(since: int = 0):
+    """
+    Delta since a previously returned `version`: upserted opportunities and deleted ids,
+    or `reset: true` when `since` is too old and the list has to be re-fetched.
+    """
+    return store.changes(since)
+
+@app.get("/api/opportunities/{opportunity_id}")
+async def get_opportunity(opportunity_id: str):
+    opp = store.get(opportunity_id)
+    if opp is None:
+        raise HTTPException(status_code=404, detail="unknown opportunity_id")
+    return opp
+
+@app.post("/api/launch/{opportunity_id}")
+async def launch_drop_by_id(opportunity_id: str):
+    opp = store.get(opportunity_id)
+    if opp is None:
+        raise HTTPException(status_code=404, detail="unknown opportunity_id")
+    return await launch_drop(opp)
 
 @app.post("/api/launch")
 async def launch_drop(opportunity: TrendOpportunity):
@@ -55,28 +130,40 @@ async def launch_drop(opportunity: TrendOpportunity):
     In a real app, this would use the Shopify Admin API to create a product.
     """
     # Mock Shopify API Call
-    print(f"Creating product: {opportunity.get('product_name')}")
-    print(f"Description: {opportunity.get('seo_description')}")
+    logger.info("creating product %r: %s", opportunity.get("product_name"), opportunity.get("seo_description"))
     
+    opp_id = opportunity.get("id")
+    if opp_id and store.get(opp_id) is not None:
+        await asyncio.to_thread(store.set_status, opp_id, "launched")
+    events.ingest([{"event_type": LAUNCHED, "properties": {"category": opportunity.get("category"), "id": opp_id}}])
+
     # Simulate success
     return {"status": "success", "shopify_product_id": "gid://shopify/Product/123456789"}
 
 @app.post("/api/track")
-async def track_event(event_data: Dict):
+async def track_event(event_data: Union[List[Dict], Dict]):
     """
-    Endpoint for Amplitude tracking.
+    Endpoint for Amplitude tracking. Accepts a single event or an array of events.
+    Events are buffered and flushed to SQLite in the background.
     """
-    event_type = event_data.get("event_type")
-    properties = event_data.get("properties")
-    print(f"[Amplitude Mock] Tracking {event_type}: {properties}")
-    
-    # Feedback loop logic (simple mock)
-    if event_type == "opportunity_rejected":
-        category = properties.get("category")
-        print(f"[AI Loop] User rejected {category}. Adjusting Oracle filters...")
-        # In a real app, we'd update a user_preference database here
-        
-    return {"status": "tracked"}
+    batch = event_data if isinstance(event_data, list) else [event_data]
+    try:
+        accepted = events.ingest(batch)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "tracked", "accepted": accepted}
+
+@app.get("/api/track/aggregates")
+async def get_event_aggregates():
+    return {"categories": events.aggregates(), "ingestion": events.stats()}
+
+@app.get("/api/thresholds")
+async def get_thresholds():
+    return get_controller().snapshot(base=oracle.base_threshold)
+
+@app.get("/api/track/aggregates/{category}")
+async def get_category_aggregate(category: str):
+    return events.aggregate(category)
 
 if __name__ == "__main__":
     import uvicorn
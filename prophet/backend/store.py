@@ -0,0 +1,283 @@
+import bisect
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing_extensions import Dict, List, Optional, Set, Tuple, Any
+from .agents.state import TrendOpportunity
+
+DEFAULT_DB_PATH = Path(__file__).with_name("prophet.sqlite3")
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+# how long a deletion stays visible to changes(); older `since` values get a reset instead
+DEFAULT_TOMBSTONE_TTL_SECONDS = 24 * 3600
+
+
+def opportunity_id(event: str, category: str) -> str:
+    """Stable id for an opportunity: same event + category always maps to the same id."""
+    key = f"{category.strip().lower()}|{' '.join(event.lower().split())}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def _encode_cursor(prob: float, opp_id: str) -> str:
+    return f"{prob!r}:{opp_id}"
+
+
+def _decode_cursor(cursor: str) -> Tuple[float, str]:
+    """Raises ValueError for anything _encode_cursor did not produce."""
+    prob, sep, opp_id = cursor.partition(":")
+    value = float(prob)
+    if not sep or not opp_id or not math.isfinite(value):
+        raise ValueError(f"invalid cursor: {cursor!r}")
+    return value, opp_id
+
+
+class OpportunityStore:
+    """
+    In-memory opportunity index backed by SQLite.
+
+    Reads never touch SQLite: the dict gives O(1) lookup/upsert, category and status
+    map to id sets, and probability is a sorted list used for range filters and
+    cursor pagination. Every write bumps a monotonically increasing version so clients
+    can poll for deltas instead of re-fetching everything. Deletions are remembered for
+    PROPHET_TOMBSTONE_TTL_SECONDS; a client polling from before that gets `reset`.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        ttl_seconds: Optional[float] = None,
+        tombstone_ttl_seconds: Optional[float] = None,
+    ):
+        self.db_path = str(db_path or os.getenv("PROPHET_DB_PATH", DEFAULT_DB_PATH))
+        self.ttl_seconds = float(ttl_seconds if ttl_seconds is not None else os.getenv("PROPHET_OPP_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+        self.tombstone_ttl_seconds = float(
+            tombstone_ttl_seconds
+            if tombstone_ttl_seconds is not None
+            else os.getenv("PROPHET_TOMBSTONE_TTL_SECONDS", DEFAULT_TOMBSTONE_TTL_SECONDS)
+        )
+
+        self._lock = threading.RLock()
+        self._items: Dict[str, TrendOpportunity] = {}
+        self._version_of: Dict[str, int] = {}
+        # id -> updated_at, oldest first, so TTL expiry only walks expired entries
+        self._updated_at: "OrderedDict[str, float]" = OrderedDict()
+        self._by_category: Dict[str, Set[str]] = {}
+        self._by_status: Dict[str, Set[str]] = {}
+        # sorted by (-probability, id): highest probability first, ties broken by id
+        self._by_prob: List[Tuple[float, str]] = []
+        # deleted id -> (version, deleted_at), oldest deletion first
+        self._tombstones: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        # versions up to here may have had their tombstones pruned
+        self._horizon = 0
+        self.version = 0
+
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS opportunities (
+                id TEXT PRIMARY KEY,
+                version INTEGER NOT NULL,
+                updated_at REAL NOT NULL,
+                deleted INTEGER NOT NULL DEFAULT 0,
+                data TEXT
+            )
+            """
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._db.commit()
+        self._load()
+
+    # ---- persistence
+
+    def _load(self) -> None:
+        rows = self._db.execute(
+            "SELECT id, version, updated_at, deleted, data FROM opportunities ORDER BY updated_at"
+        ).fetchall()
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'tombstone_horizon'").fetchone()
+        self._horizon = self.version = row[0] if row else 0
+        for opp_id, version, updated_at, deleted, data in rows:
+            self.version = max(self.version, version)
+            if deleted:
+                self._tombstones[opp_id] = (version, updated_at)
+            else:
+                self._index(opp_id, json.loads(data), version, updated_at)
+        self.expire()
+
+    def _persist(self, opp_id: str, version: int, updated_at: float, opp: Optional[TrendOpportunity]) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO opportunities (id, version, updated_at, deleted, data) VALUES (?, ?, ?, ?, ?)",
+            (opp_id, version, updated_at, 0 if opp is not None else 1, json.dumps(opp) if opp is not None else None),
+        )
+
+    def _tombstone(self, opp_id: str, now: float) -> None:
+        self.version += 1
+        self._tombstones[opp_id] = (self.version, now)
+        self._tombstones.move_to_end(opp_id)
+        self._persist(opp_id, self.version, now, None)
+
+    def _prune_tombstones(self, now: float) -> int:
+        if self.tombstone_ttl_seconds <= 0:
+            return 0
+        cutoff = now - self.tombstone_ttl_seconds
+        pruned = []
+        while self._tombstones:
+            opp_id, (version, deleted_at) = next(iter(self._tombstones.items()))
+            if deleted_at >= cutoff:
+                break
+            del self._tombstones[opp_id]
+            self._horizon = max(self._horizon, version)
+            pruned.append(opp_id)
+        if pruned:
+            self._db.executemany("DELETE FROM opportunities WHERE id = ? AND deleted = 1", [(i,) for i in pruned])
+            self._db.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('tombstone_horizon', ?)", (self._horizon,)
+            )
+        return len(pruned)
+
+    # ---- indexes
+
+    def _index(self, opp_id: str, opp: TrendOpportunity, version: int, updated_at: float) -> None:
+        self._items[opp_id] = opp
+        self._version_of[opp_id] = version
+        self._updated_at[opp_id] = updated_at
+        self._updated_at.move_to_end(opp_id)
+        self._by_category.setdefault(opp["category"], set()).add(opp_id)
+        self._by_status.setdefault(opp["status"], set()).add(opp_id)
+        bisect.insort(self._by_prob, (-float(opp["probability"]), opp_id))
+        self._tombstones.pop(opp_id, None)
+
+    def _unindex(self, opp_id: str) -> Optional[TrendOpportunity]:
+        opp = self._items.pop(opp_id, None)
+        if opp is None:
+            return None
+        self._version_of.pop(opp_id, None)
+        self._updated_at.pop(opp_id, None)
+        for index, key in ((self._by_category, opp["category"]), (self._by_status, opp["status"])):
+            ids = index.get(key)
+            if ids is not None:
+                ids.discard(opp_id)
+                if not ids:
+                    del index[key]
+        pos = bisect.bisect_left(self._by_prob, (-float(opp["probability"]), opp_id))
+        if pos < len(self._by_prob) and self._by_prob[pos][1] == opp_id:
+            del self._by_prob[pos]
+        return opp
+
+    # ---- public API
+
+    def get(self, opp_id: str) -> Optional[TrendOpportunity]:
+        with self._lock:
+            return self._items.get(opp_id)
+
+    def upsert(self, opp: TrendOpportunity) -> TrendOpportunity:
+        return self.upsert_many([opp])[0]
+
+    def upsert_many(self, opps: List[TrendOpportunity]) -> List[TrendOpportunity]:
+        now = time.time()
+        with self._lock:
+            for opp in opps:
+                if not opp.get("id"):
+                    opp["id"] = opportunity_id(opp["event"], opp["category"])
+                self._unindex(opp["id"])
+                self.version += 1
+                self._index(opp["id"], opp, self.version, now)
+                self._persist(opp["id"], self.version, now, opp)
+            self._db.commit()
+        return opps
+
+    def set_status(self, opp_id: str, status: str) -> Optional[TrendOpportunity]:
+        with self._lock:
+            opp = self._items.get(opp_id)
+            if opp is None:
+                return None
+            updated = dict(opp)
+            updated["status"] = status
+            return self.upsert(updated)
+
+    def delete(self, opp_id: str) -> bool:
+        with self._lock:
+            if self._unindex(opp_id) is None:
+                return False
+            self._tombstone(opp_id, time.time())
+            self._db.commit()
+            return True
+
+    def expire(self) -> int:
+        """
+        Drop opportunities not refreshed within the TTL and forget deletions older than
+        the tombstone TTL. Returns how many opportunities were removed.
+        """
+        now = time.time()
+        cutoff = now - self.ttl_seconds
+        removed = 0
+        with self._lock:
+            while self.ttl_seconds > 0 and self._updated_at:
+                opp_id, updated_at = next(iter(self._updated_at.items()))
+                if updated_at >= cutoff:
+                    break
+                self._unindex(opp_id)
+                self._tombstone(opp_id, now)
+                removed += 1
+            if self._prune_tombstones(now) or removed:
+                self._db.commit()
+        return removed
+
+    def page(
+        self,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        category: Optional[str] = None,
+        status: Optional[str] = None,
+        min_prob: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Highest-probability first. Pass back `next_cursor` to continue; a malformed one raises ValueError."""
+        self.expire()
+        with self._lock:
+            allowed: Optional[Set[str]] = None
+            for index, key in ((self._by_category, category), (self._by_status, status)):
+                if key is not None:
+                    ids = index.get(key, set())
+                    allowed = ids if allowed is None else allowed & ids
+
+            start = 0
+            if cursor:
+                prob, last_id = _decode_cursor(cursor)
+                start = bisect.bisect_right(self._by_prob, (-prob, last_id))
+
+            items: List[TrendOpportunity] = []
+            next_cursor = None
+            for neg_prob, opp_id in self._by_prob[start:]:
+                if min_prob is not None and -neg_prob < min_prob:
+                    break
+                if allowed is not None and opp_id not in allowed:
+                    continue
+                if len(items) == limit:
+                    last = items[-1]
+                    next_cursor = _encode_cursor(float(last["probability"]), last["id"])
+                    break
+                items.append(self._items[opp_id])
+
+            return {"items": items, "next_cursor": next_cursor, "version": self.version}
+
+    def changes(self, since: int) -> Dict[str, Any]:
+        """
+        Everything upserted or removed after `since` (a previously returned version).
+        If deletions after `since` may already be forgotten, returns `reset: true` and no
+        delta: the client has to re-fetch from page() and poll from the new version.
+        """
+        self.expire()
+        with self._lock:
+            if since < self._horizon:
+                return {"upserted": [], "deleted": [], "version": self.version, "reset": True}
+            upserted = [self._items[i] for i, v in self._version_of.items() if v > since]
+            deleted = [i for i, (v, _) in self._tombstones.items() if v > since]
+            return {"upserted": upserted, "deleted": deleted, "version": self.version, "reset": False}
+
+    def __len__(self) -> int:
+        return len(self._items)